@@ -91,10 +91,21 @@ function marketTzTimeToUtcDate(
   return new Date(utcGuess.getTime() - offsetMs);
 }
 
-function parseIbkrDate(dateStr: string): Date | null {
-  // Handle both formats:
-  // 1. ISO 8601 from Python bridge: "2026-01-26T14:55:00+00:00" (already UTC)
-  // 2. Legacy IBKR format: "20251202" or "20251202  10:30:00" (Eastern Time)
+function parseIbkrDate(dateStr: string | number): Date | null {
+  // Handle all formats:
+  // 1. Epoch milliseconds from Python bridge (EMIT_ISO_TIMESTAMPS=false)
+  // 2. ISO 8601 from Python bridge: "2026-01-26T14:55:00+00:00" (already UTC)
+  // 3. Legacy IBKR format: "20251202" or "20251202  10:30:00" (Eastern Time)
+
+  if (typeof dateStr === "number") {
+    // Epoch milliseconds from Python bridge - already in UTC
+    const parsed = new Date(dateStr);
+    if (!isNaN(parsed.getTime())) {
+      return parsed;
+    }
+    logger.warn(`Failed to parse epoch date: ${dateStr}`);
+    return null;
+  }
 
   // Check if it's ISO 8601 format (contains 'T' or '-')
   if (dateStr.includes('T') || dateStr.includes('-')) {
@@ -86,7 +86,7 @@ export interface IbkrConfig {
 }
 
 export interface IbkrBar {
-  date: string;  // with formatDate=2 => epoch seconds as string
+  date: string | number;  // with formatDate=2 => epoch seconds as string; number = epoch ms from Python bridge (EMIT_ISO_TIMESTAMPS=false)
   open: number;
   high: number;
   low: number;
@@ -21,7 +21,7 @@ interface BarUpdateMessage {
   type: "bar_update";
   symbol: string;
   bar: {
-    date: string;
+    date: string | number; // number = epoch ms (EMIT_ISO_TIMESTAMPS=false)
     open: number;
     high: number;
     low: number;
@@ -33,6 +33,12 @@ interface BarUpdateMessage {
   timestamp: string;
 }
 
+interface BarBatchMessage {
+  type: "bar_batch";
+  symbol: string;
+  bars: BarUpdateMessage["bar"][];
+}
+
 interface SubscribedMessage {
   type: "subscribed";
   symbol: string;
@@ -48,7 +54,7 @@ interface ErrorMessage {
   symbol?: string;
 }
 
-type ServerMessage = BarUpdateMessage | SubscribedMessage | ErrorMessage | { type: string };
+type ServerMessage = BarUpdateMessage | BarBatchMessage | SubscribedMessage | ErrorMessage | { type: string };
 
 /**
  * Real-time bar streaming client
@@ -262,6 +268,15 @@ export class RealtimeBarClient extends EventEmitter {
         this.handleBarUpdate(message as BarUpdateMessage);
         break;
 
+      case "bar_batch": {
+        // Server coalesces rapid updates for a symbol into one message
+        const { symbol, bars } = message as BarBatchMessage;
+        for (const bar of bars) {
+          this.handleBarUpdate({ type: "bar_update", symbol, bar, timestamp: String(bar.date) });
+        }
+        break;
+      }
+
       case "subscribed":
         this.handleSubscribed(message as SubscribedMessage);
         break;
@@ -292,12 +307,16 @@ export class RealtimeBarClient extends EventEmitter {
     logger.debug(`🔄 Bar update: ${symbol} | ${bar.date} | C=$${bar.close} | V=${bar.volume}`);
 
     // Parse date format to Unix timestamp
-    // Handle both formats:
-    // 1. ISO 8601 from Python bridge: "2026-01-27T19:15:00+00:00" (already UTC)
-    // 2. Legacy IBKR format: "20260126  10:30:00"
+    // Handle all formats:
+    // 1. Epoch milliseconds from Python bridge (EMIT_ISO_TIMESTAMPS=false)
+    // 2. ISO 8601 from Python bridge: "2026-01-27T19:15:00+00:00" (already UTC)
+    // 3. Legacy IBKR format: "20260126  10:30:00"
     let timestamp: number;
 
-    if (bar.date.includes('T') || bar.date.includes('-')) {
+    if (typeof bar.date === 'number') {
+      // Epoch milliseconds - already in UTC
+      timestamp = new Date(bar.date).getTime();
+    } else if (bar.date.includes('T') || bar.date.includes('-')) {
       // ISO 8601 format from Python bridge - already in UTC
       const parsed = new Date(bar.date);
       if (isNaN(parsed.getTime())) {
@@ -1,7 +1,7 @@
 """Request and response models for the API."""
 
-from typing import List, Optional, Dict, Any
-from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Union
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class BarRequest(BaseModel):
@@ -15,8 +15,9 @@ class BarRequest(BaseModel):
     include_forming: bool = Field(default=False, description="Include forming (incomplete) bar")
     end_datetime: str = Field(default="", description="End datetime (empty=now, format: '20250126 10:30:00')")
 
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        extra="ignore",
+        json_schema_extra={
             "example": {
                 "symbol": "AAPL",
                 "period": "5m",
@@ -27,12 +28,15 @@ class BarRequest(BaseModel):
                 "end_datetime": ""
             }
         }
+    )
 
 
 class Bar(BaseModel):
     """Response model for a single bar."""
 
-    date: str = Field(..., description="Bar timestamp (format: 'yyyyMMdd HH:mm:ss')")
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
+    date: Union[str, int] = Field(..., description="Bar timestamp (ISO 8601 UTC, or epoch milliseconds when EMIT_ISO_TIMESTAMPS=false)")
     open: float = Field(..., description="Open price")
     high: float = Field(..., description="High price")
     low: float = Field(..., description="Low price")
@@ -1,27 +1,57 @@
 """API routes for the TWS Bridge Server."""
 
 import logging
-import time
-from typing import Dict, Any
+from time import monotonic
+from typing import Dict, Any, Iterator, List
+
+import orjson
 from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import StreamingResponse
 
 from api.models import (
     BarRequest,
     BarResponse,
-    Bar,
     HealthResponse,
     ErrorResponse
 )
+from api.responses import ORJSONResponse
+from config import TWS_HOST, TWS_PORT
 from tws.connection_manager import get_http_connection
 import tws.bar_fetcher as bar_fetcher_module
 
 logger = logging.getLogger(__name__)
 
+__all__ = ["router"]
+
 # Router instance
 router = APIRouter()
 
-# Server start time for uptime calculation
-server_start_time = time.time()
+# Server start time for uptime calculation (monotonic, immune to clock changes)
+server_start_time = monotonic()
+
+# Number of bars serialized per streamed chunk
+BAR_STREAM_CHUNK_SIZE = 256
+
+
+def _stream_bars(request: BarRequest, bars_data: List[Dict[str, Any]]) -> Iterator[bytes]:
+    """
+    Yield a BarResponse JSON document in chunks.
+
+    Bars are serialized BAR_STREAM_CHUNK_SIZE at a time so large responses
+    never have to be held in memory as a single encoded payload.
+    """
+    yield (
+        b'{"success":true,"symbol":' + orjson.dumps(request.symbol)
+        + b',"period":' + orjson.dumps(request.period)
+        + b',"bars":['
+    )
+
+    for start in range(0, len(bars_data), BAR_STREAM_CHUNK_SIZE):
+        # Serialize the slice as a list and strip the surrounding brackets
+        chunk = orjson.dumps(bars_data[start:start + BAR_STREAM_CHUNK_SIZE])[1:-1]
+        yield chunk if start == 0 else b"," + chunk
+
+    yield b'],"count":' + str(len(bars_data)).encode() + b',"error":null}'
 
 
 @router.get("/health", response_model=HealthResponse)
@@ -31,17 +61,18 @@ async def health_check():
 
     Returns server status and TWS connection state.
     """
-    connected = get_http_connection().is_connected()
-    uptime = time.time() - server_start_time
-
-    return HealthResponse(
-        status="ok" if connected else "degraded",
-        connected=connected,
-        tws_host=get_http_connection().client.host if hasattr(get_http_connection().client, 'host') else "unknown",
-        tws_port=get_http_connection().client.port if hasattr(get_http_connection().client, 'port') else 0,
-        uptime_seconds=uptime,
-        version="1.0.0"
-    )
+    conn = get_http_connection()
+    connected = conn.is_connected()
+    uptime = monotonic() - server_start_time
+
+    return ORJSONResponse({
+        "status": "ok" if connected else "degraded",
+        "connected": connected,
+        "tws_host": TWS_HOST,
+        "tws_port": TWS_PORT,
+        "uptime_seconds": uptime,
+        "version": "1.0.0"
+    })
 
 
 @router.post("/bars", response_model=BarResponse)
@@ -69,7 +100,7 @@ async def fetch_bars(request: BarRequest):
                 )
 
         # Fetch bars
-        bars_data = bar_fetcher_module.bar_fetcher.fetch_bars(
+        bars_data = await bar_fetcher_module.bar_fetcher.fetch_bars_async(
             symbol=request.symbol,
             period=request.period,
             duration=request.duration,
@@ -79,46 +110,41 @@ async def fetch_bars(request: BarRequest):
             end_datetime=request.end_datetime
         )
 
-        # Convert to response model
-        bars = [Bar(**bar_dict) for bar_dict in bars_data]
-
         logger.info(
-            f"✅ API: Fetched {len(bars)} bars for {request.symbol} "
-            f"(period={request.period}, duration={request.duration})"
+            "✅ API: Fetched %s bars for %s (period=%s, duration=%s)",
+            len(bars_data), request.symbol, request.period, request.duration
         )
 
-        return BarResponse(
-            success=True,
-            symbol=request.symbol,
-            period=request.period,
-            bars=bars,
-            count=len(bars),
-            error=None
+        # Bars are already plain dicts shaped like Bar, so stream them out
+        # directly instead of round-tripping through the response model
+        return StreamingResponse(
+            _stream_bars(request, bars_data),
+            media_type="application/json"
         )
 
     except TimeoutError as e:
-        logger.error(f"❌ Bar fetch timeout: {e}")
+        logger.error("❌ Bar fetch timeout: %s", e)
         raise HTTPException(
             status_code=status.HTTP_504_GATEWAY_TIMEOUT,
             detail=str(e)
         )
 
     except ValueError as e:
-        logger.error(f"❌ Invalid request parameters: {e}")
+        logger.error("❌ Invalid request parameters: %s", e)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
 
     except RuntimeError as e:
-        logger.error(f"❌ Bar fetch failed: {e}")
+        logger.error("❌ Bar fetch failed: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
 
     except Exception as e:
-        logger.error(f"❌ Unexpected error: {e}", exc_info=True)
+        logger.error("❌ Unexpected error: %s", e, exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -135,12 +161,12 @@ async def connect_to_tws():
     """
     try:
         if get_http_connection().is_connected():
-            return {"success": True, "message": "Already connected to TWS"}
+            return ORJSONResponse({"success": True, "message": "Already connected to TWS"})
 
         success = get_http_connection().connect()
 
         if success:
-            return {"success": True, "message": "Connected to TWS"}
+            return ORJSONResponse({"success": True, "message": "Connected to TWS"})
         else:
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -148,7 +174,7 @@ async def connect_to_tws():
             )
 
     except Exception as e:
-        logger.error(f"❌ Connection error: {e}", exc_info=True)
+        logger.error("❌ Connection error: %s", e, exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
@@ -165,10 +191,10 @@ async def disconnect_from_tws():
     """
     try:
         get_http_connection().disconnect()
-        return {"success": True, "message": "Disconnected from TWS"}
+        return ORJSONResponse({"success": True, "message": "Disconnected from TWS"})
 
     except Exception as e:
-        logger.error(f"❌ Disconnection error: {e}", exc_info=True)
+        logger.error("❌ Disconnection error: %s", e, exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
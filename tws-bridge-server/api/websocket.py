@@ -1,11 +1,16 @@
 """WebSocket routes for real-time bar streaming."""
 
+import asyncio
+import itertools
 import logging
-import json
-import uuid
-from typing import Dict, Set
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+import orjson
 from fastapi import WebSocket, WebSocketDisconnect
+from starlette.websockets import WebSocketState
 
+from config import WS_BAR_FLUSH_INTERVAL, WS_OUTBOUND_QUEUE_SIZE
 import tws.streaming_manager as streaming_manager_module
 
 logger = logging.getLogger(__name__)
@@ -14,75 +19,311 @@ logger = logging.getLogger(__name__)
 class ConnectionManager:
     """Manages WebSocket connections."""
 
-    def __init__(self):
+    def __init__(
+        self,
+        outbound_queue_size: int = WS_OUTBOUND_QUEUE_SIZE,
+        bar_flush_interval: float = WS_BAR_FLUSH_INTERVAL
+    ):
         self.active_connections: Dict[str, WebSocket] = {}
         self.connection_subscriptions: Dict[str, Set[str]] = {}  # connection_id -> set of symbols
+        self._symbol_subs: Dict[str, Set[str]] = defaultdict(set)  # symbol -> set of connection_ids
+        self.outbound_queue_size = outbound_queue_size
+        self.outbound_queues: Dict[str, asyncio.Queue] = {}  # connection_id -> encoded frames
+        self.writers: Dict[str, asyncio.Task] = {}  # connection_id -> writer task
+        self._connection_ids = itertools.count(1)  # IDs are only used as internal keys
+        self.bar_flush_interval = bar_flush_interval
+        self._pending_bars: Dict[str, List[Dict]] = defaultdict(list)  # symbol -> bars awaiting flush
+        self._flusher: Optional[asyncio.Task] = None
+        self._teardowns: Set[asyncio.Task] = set()  # slow-client disconnects in flight
 
     async def connect(self, websocket: WebSocket) -> str:
         """Accept WebSocket connection and return connection ID."""
         try:
             logger.info("Accepting WebSocket connection...")
             await websocket.accept()
-            connection_id = str(uuid.uuid4())
+            connection_id = f"ws-{next(self._connection_ids)}"
             self.active_connections[connection_id] = websocket
             self.connection_subscriptions[connection_id] = set()
-            logger.info(f"✅ WebSocket connected: {connection_id}")
+
+            queue: asyncio.Queue = asyncio.Queue(maxsize=self.outbound_queue_size)
+            self.outbound_queues[connection_id] = queue
+            self.writers[connection_id] = asyncio.create_task(
+                self._writer_loop(connection_id, websocket, queue)
+            )
+
+            logger.info("✅ WebSocket connected: %s", connection_id)
             return connection_id
         except Exception as e:
-            logger.error(f"❌ Failed to accept WebSocket connection: {e}")
+            logger.error("❌ Failed to accept WebSocket connection: %s", e)
             raise
 
     async def disconnect(self, connection_id: str):
         """Disconnect WebSocket and cleanup subscriptions."""
-        if connection_id in self.active_connections:
-            # Unsubscribe from all streams
-            await streaming_manager_module.streaming_manager.unsubscribe_all(connection_id)
+        websocket = self.active_connections.pop(connection_id, None)
+        if websocket is None:
+            return
+
+        # Remove connection
+        for symbol in self.connection_subscriptions.pop(connection_id, ()):
+            self._drop_symbol_subscriber(symbol, connection_id)
+        self.outbound_queues.pop(connection_id, None)
+
+        # Stop the writer (unless it is the one tearing the connection down)
+        writer = self.writers.pop(connection_id, None)
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
+
+        # Close the socket if the client is still there (e.g. dropped as too slow)
+        if websocket.client_state == WebSocketState.CONNECTED:
+            try:
+                await websocket.close()
+            except Exception as e:
+                logger.debug("Close error for %s: %s", connection_id, e)
 
-            # Remove connection
-            del self.active_connections[connection_id]
-            if connection_id in self.connection_subscriptions:
-                del self.connection_subscriptions[connection_id]
+        # Unsubscribe from all streams
+        await streaming_manager_module.streaming_manager.unsubscribe_all(connection_id)
 
-            logger.info(f"🔌 WebSocket disconnected: {connection_id}")
+        logger.info("🔌 WebSocket disconnected: %s", connection_id)
 
     async def send_message(self, connection_id: str, message: Dict):
-        """Send message to specific connection."""
+        """Queue message for a specific connection."""
         if connection_id in self.active_connections:
-            websocket = self.active_connections[connection_id]
-            try:
-                await websocket.send_json(message)
-            except Exception as e:
-                logger.error(f"❌ Failed to send message to {connection_id}: {e}")
-                await self.disconnect(connection_id)
+            await self._enqueue(connection_id, orjson.dumps(message).decode())
 
     async def broadcast_to_symbol_subscribers(self, symbol: str, message: Dict):
         """Broadcast message to all connections subscribed to a symbol."""
-        for connection_id, subscriptions in self.connection_subscriptions.items():
-            if symbol in subscriptions:
-                await self.send_message(connection_id, message)
+        connection_ids = list(self._symbol_subs.get(symbol, ()))
+        if not connection_ids:
+            return
+
+        # Serialize once; each connection's writer task does the actual send,
+        # so one slow client doesn't hold up the rest
+        text = orjson.dumps(message).decode()
+        for connection_id in connection_ids:
+            await self._enqueue(connection_id, text)
+
+    async def queue_bar_update(self, symbol: str, bar_dict: Dict):
+        """
+        Coalesce a bar update for broadcast.
+
+        Updates arriving within bar_flush_interval are sent to each subscriber
+        as one message: a single pending bar goes out as "bar_update", several
+        as one "bar_batch". An interval of 0 disables coalescing.
+        """
+        if self.bar_flush_interval <= 0:
+            await self.broadcast_to_symbol_subscribers(symbol, _bar_update_message(symbol, bar_dict))
+            return
+
+        self._pending_bars[symbol].append(bar_dict)
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_pending_bars())
+
+    async def _flush_pending_bars(self):
+        """Wait one flush interval, then broadcast everything that accumulated."""
+        await asyncio.sleep(self.bar_flush_interval)
+
+        pending = self._pending_bars
+        self._pending_bars = defaultdict(list)
+        self._flusher = None
+
+        for symbol, bars in pending.items():
+            if len(bars) == 1:
+                message = _bar_update_message(symbol, bars[0])
+            else:
+                message = {
+                    "type": "bar_batch",
+                    "symbol": symbol,
+                    "bars": bars
+                }
+            await self.broadcast_to_symbol_subscribers(symbol, message)
+
+    async def _enqueue(self, connection_id: str, text: str):
+        """Hand an encoded frame to the connection's writer, dropping clients that fall behind."""
+        queue = self.outbound_queues.get(connection_id)
+        if queue is None:
+            return
+
+        try:
+            queue.put_nowait(text)
+        except asyncio.QueueFull:
+            logger.warning(
+                "⚠️  Outbound queue full for %s (%s messages), dropping slow client",
+                connection_id, self.outbound_queue_size
+            )
+            # Stop queueing now, but close the socket off this path so the
+            # fan-out to other subscribers isn't held up by the slow client
+            self.outbound_queues.pop(connection_id, None)
+            teardown = asyncio.create_task(self.disconnect(connection_id))
+            self._teardowns.add(teardown)
+            teardown.add_done_callback(self._teardowns.discard)
+
+    async def _writer_loop(self, connection_id: str, websocket: WebSocket, queue: asyncio.Queue):
+        """Drain a connection's outbound queue onto its socket."""
+        while True:
+            text = await queue.get()
+            try:
+                await websocket.send_text(text)
+            except Exception as e:
+                logger.error("❌ Failed to send message to %s: %s", connection_id, e)
+                await self.disconnect(connection_id)
+                return
 
     def add_subscription(self, connection_id: str, symbol: str):
         """Track symbol subscription for connection."""
         if connection_id in self.connection_subscriptions:
             self.connection_subscriptions[connection_id].add(symbol)
+            self._symbol_subs[symbol].add(connection_id)
 
     def remove_subscription(self, connection_id: str, symbol: str):
         """Remove symbol subscription for connection."""
         if connection_id in self.connection_subscriptions:
             self.connection_subscriptions[connection_id].discard(symbol)
+            self._drop_symbol_subscriber(symbol, connection_id)
+
+    def _drop_symbol_subscriber(self, symbol: str, connection_id: str):
+        """Remove connection from a symbol's subscriber index."""
+        subscribers = self._symbol_subs.get(symbol)
+        if subscribers is not None:
+            subscribers.discard(connection_id)
+            if not subscribers:
+                del self._symbol_subs[symbol]
 
 
 # Global connection manager
 connection_manager = ConnectionManager()
 
 
+def _bar_update_message(symbol: str, bar_dict: Dict) -> Dict:
+    """Build a single-bar update message."""
+    return {
+        "type": "bar_update",
+        "symbol": symbol,
+        "bar": bar_dict,
+        "timestamp": bar_dict["date"]
+    }
+
+
+async def _bar_update_callback(symbol: str, bar_dict: Dict):
+    """Send bar update to every WebSocket client subscribed to the symbol."""
+    await connection_manager.queue_bar_update(symbol, bar_dict)
+
+
+async def _handle_ping(connection_id: str, data: Dict):
+    """Answer a client heartbeat."""
+    await connection_manager.send_message(connection_id, {"type": "pong"})
+
+
+async def _handle_subscribe(connection_id: str, data: Dict):
+    """Subscribe the connection to a symbol's bar stream."""
+    symbol = data.get("symbol")
+
+    # Validate parameters
+    if not symbol:
+        await connection_manager.send_message(connection_id, {
+            "type": "error",
+            "error": "Missing symbol parameter"
+        })
+        return
+
+    period = data.get("period", "5m")
+    session = data.get("session", "rth")
+    what = data.get("what", "TRADES")
+
+    try:
+        # Subscribe to streaming
+        result = await streaming_manager_module.streaming_manager.subscribe(
+            symbol=symbol,
+            period=period,
+            session=session,
+            what=what,
+            connection_id=connection_id,
+            callback=_bar_update_callback
+        )
+
+        # Track subscription
+        connection_manager.add_subscription(connection_id, symbol)
+
+        # Send confirmation
+        await connection_manager.send_message(connection_id, {
+            "type": "subscribed",
+            "symbol": symbol,
+            "period": period,
+            "session": session,
+            "what": what,
+            "req_id": result["req_id"],
+            "existing": result["existing"]
+        })
+
+        logger.info("📡 %s subscribed to %s stream", connection_id, symbol)
+
+    except Exception as e:
+        logger.error("❌ Subscription failed for %s: %s", symbol, e)
+        await connection_manager.send_message(connection_id, {
+            "type": "error",
+            "action": "subscribe",
+            "symbol": symbol,
+            "error": str(e)
+        })
+
+
+async def _handle_unsubscribe(connection_id: str, data: Dict):
+    """Unsubscribe the connection from a symbol's bar stream."""
+    symbol = data.get("symbol")
+
+    if not symbol:
+        await connection_manager.send_message(connection_id, {
+            "type": "error",
+            "error": "Missing symbol parameter"
+        })
+        return
+
+    try:
+        result = await streaming_manager_module.streaming_manager.unsubscribe(symbol, connection_id)
+        connection_manager.remove_subscription(connection_id, symbol)
+
+        await connection_manager.send_message(connection_id, {
+            "type": "unsubscribed",
+            "symbol": symbol,
+            "status": result["status"]
+        })
+
+        logger.info("📡 %s unsubscribed from %s stream", connection_id, symbol)
+
+    except Exception as e:
+        logger.error("❌ Unsubscribe failed for %s: %s", symbol, e)
+        await connection_manager.send_message(connection_id, {
+            "type": "error",
+            "action": "unsubscribe",
+            "symbol": symbol,
+            "error": str(e)
+        })
+
+
+async def _handle_list_subscriptions(connection_id: str, data: Dict):
+    """Report the server's active subscriptions."""
+    subscriptions = streaming_manager_module.streaming_manager.get_active_subscriptions()
+    await connection_manager.send_message(connection_id, {
+        "type": "subscriptions",
+        "subscriptions": subscriptions
+    })
+
+
+# Client action -> handler
+_ACTION_HANDLERS: Dict[str, Callable[[str, Dict], Awaitable[None]]] = {
+    "ping": _handle_ping,
+    "subscribe": _handle_subscribe,
+    "unsubscribe": _handle_unsubscribe,
+    "list_subscriptions": _handle_list_subscriptions,
+}
+
+
 async def handle_websocket(websocket: WebSocket):
     """
     Handle WebSocket connection for real-time bar streaming.
 
     Message format (client -> server):
     {
-        "action": "subscribe" | "unsubscribe" | "ping",
+        "action": "subscribe" | "unsubscribe" | "ping" | "list_subscriptions",
         "symbol": "AAPL",
         "period": "5m",
         "session": "rth",
@@ -96,12 +337,20 @@ async def handle_websocket(websocket: WebSocket):
         "bar": { ... },
         "timestamp": "2026-01-26T10:30:00Z"
     }
+
+    Updates for the same symbol that arrive within WS_BAR_FLUSH_INTERVAL are
+    coalesced into one message:
+    {
+        "type": "bar_batch",
+        "symbol": "AAPL",
+        "bars": [{ ... }, { ... }]
+    }
     """
     connection_id = await connection_manager.connect(websocket)
 
     try:
         # Send welcome message
-        await websocket.send_json({
+        await connection_manager.send_message(connection_id, {
             "type": "connected",
             "connection_id": connection_id,
             "message": "Connected to TWS Bridge streaming server"
@@ -110,121 +359,23 @@ async def handle_websocket(websocket: WebSocket):
         # Message loop
         while True:
             # Receive message from client
-            data = await websocket.receive_json()
+            data = orjson.loads(await websocket.receive_text())
 
             action = data.get("action")
-            symbol = data.get("symbol")
-
-            if action == "ping":
-                await websocket.send_json({"type": "pong"})
-                continue
-
-            if action == "subscribe":
-                # Validate parameters
-                if not symbol:
-                    await websocket.send_json({
-                        "type": "error",
-                        "error": "Missing symbol parameter"
-                    })
-                    continue
-
-                period = data.get("period", "5m")
-                session = data.get("session", "rth")
-                what = data.get("what", "TRADES")
-
-                try:
-                    # Define callback for bar updates
-                    async def bar_update_callback(sym: str, bar_dict: Dict):
-                        """Send bar update to WebSocket client."""
-                        await connection_manager.broadcast_to_symbol_subscribers(sym, {
-                            "type": "bar_update",
-                            "symbol": sym,
-                            "bar": bar_dict,
-                            "timestamp": bar_dict["date"]
-                        })
-
-                    # Subscribe to streaming
-                    result = await streaming_manager_module.streaming_manager.subscribe(
-                        symbol=symbol,
-                        period=period,
-                        session=session,
-                        what=what,
-                        connection_id=connection_id,
-                        callback=bar_update_callback
-                    )
-
-                    # Track subscription
-                    connection_manager.add_subscription(connection_id, symbol)
-
-                    # Send confirmation
-                    await websocket.send_json({
-                        "type": "subscribed",
-                        "symbol": symbol,
-                        "period": period,
-                        "session": session,
-                        "what": what,
-                        "req_id": result["req_id"],
-                        "existing": result["existing"]
-                    })
-
-                    logger.info(f"📡 {connection_id} subscribed to {symbol} stream")
-
-                except Exception as e:
-                    logger.error(f"❌ Subscription failed for {symbol}: {e}")
-                    await websocket.send_json({
-                        "type": "error",
-                        "action": "subscribe",
-                        "symbol": symbol,
-                        "error": str(e)
-                    })
-
-            elif action == "unsubscribe":
-                if not symbol:
-                    await websocket.send_json({
-                        "type": "error",
-                        "error": "Missing symbol parameter"
-                    })
-                    continue
-
-                try:
-                    result = await streaming_manager_module.streaming_manager.unsubscribe(symbol, connection_id)
-                    connection_manager.remove_subscription(connection_id, symbol)
-
-                    await websocket.send_json({
-                        "type": "unsubscribed",
-                        "symbol": symbol,
-                        "status": result["status"]
-                    })
-
-                    logger.info(f"📡 {connection_id} unsubscribed from {symbol} stream")
-
-                except Exception as e:
-                    logger.error(f"❌ Unsubscribe failed for {symbol}: {e}")
-                    await websocket.send_json({
-                        "type": "error",
-                        "action": "unsubscribe",
-                        "symbol": symbol,
-                        "error": str(e)
-                    })
-
-            elif action == "list_subscriptions":
-                # Get active subscriptions
-                subscriptions = streaming_manager_module.streaming_manager.get_active_subscriptions()
-                await websocket.send_json({
-                    "type": "subscriptions",
-                    "subscriptions": subscriptions
-                })
+            handler = _ACTION_HANDLERS.get(action)
 
+            if handler is not None:
+                await handler(connection_id, data)
             else:
-                await websocket.send_json({
+                await connection_manager.send_message(connection_id, {
                     "type": "error",
                     "error": f"Unknown action: {action}"
                 })
 
     except WebSocketDisconnect:
-        logger.info(f"🔌 WebSocket disconnected: {connection_id}")
+        logger.info("🔌 WebSocket disconnected: %s", connection_id)
         await connection_manager.disconnect(connection_id)
 
     except Exception as e:
-        logger.error(f"❌ WebSocket error for {connection_id}: {e}", exc_info=True)
+        logger.error("❌ WebSocket error for %s: %s", connection_id, e, exc_info=True)
         await connection_manager.disconnect(connection_id)
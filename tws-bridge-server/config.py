@@ -1,5 +1,7 @@
 """Configuration management for TWS Bridge Server."""
 
+from typing import Final
+
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
@@ -11,6 +13,7 @@ class Settings(BaseSettings):
     port: int = Field(default=3003, description="Server port")
     host: str = Field(default="0.0.0.0", description="Server host")
     log_level: str = Field(default="INFO", description="Logging level")
+    access_log: bool = Field(default=False, description="Log every HTTP request (uvicorn access log)")
 
     # TWS Connection
     tws_host: str = Field(default="127.0.0.1", description="TWS host")
@@ -26,6 +29,11 @@ class Settings(BaseSettings):
     max_concurrent_requests: int = Field(default=10, description="Maximum concurrent TWS requests")
     request_timeout: int = Field(default=30, description="Request timeout (seconds)")
     bar_fetch_timeout: int = Field(default=30, description="Bar fetch timeout (seconds)")
+    emit_iso_timestamps: bool = Field(default=True, description="Emit bar dates as ISO 8601 UTC strings (False = epoch milliseconds)")
+
+    # WebSocket Streaming
+    ws_outbound_queue_size: int = Field(default=1024, description="Max queued outbound messages per WebSocket client before it is dropped")
+    ws_bar_flush_interval: float = Field(default=0.02, description="Window for coalescing bar updates per symbol (seconds, 0=disabled)")
 
     # Health Check
     health_check_interval: int = Field(default=60, description="Health check interval (seconds)")
@@ -37,3 +45,22 @@ class Settings(BaseSettings):
 
 # Global settings instance
 settings = Settings()
+
+# Frozen values for use at runtime (settings are read once at import)
+HOST: Final[str] = settings.host
+PORT: Final[int] = settings.port
+LOG_LEVEL: Final[str] = settings.log_level
+ACCESS_LOG: Final[bool] = settings.access_log
+TWS_HOST: Final[str] = settings.tws_host
+TWS_PORT: Final[int] = settings.tws_port
+TWS_CLIENT_ID: Final[int] = settings.tws_client_id
+TWS_CONNECT_TIMEOUT: Final[int] = settings.tws_connect_timeout
+TWS_READ_TIMEOUT: Final[int] = settings.tws_read_timeout
+TWS_MARKET_DATA_TYPE: Final[int] = settings.tws_market_data_type
+MAX_CONCURRENT_REQUESTS: Final[int] = settings.max_concurrent_requests
+REQUEST_TIMEOUT: Final[int] = settings.request_timeout
+BAR_FETCH_TIMEOUT: Final[int] = settings.bar_fetch_timeout
+EMIT_ISO_TIMESTAMPS: Final[bool] = settings.emit_iso_timestamps
+WS_OUTBOUND_QUEUE_SIZE: Final[int] = settings.ws_outbound_queue_size
+WS_BAR_FLUSH_INTERVAL: Final[float] = settings.ws_bar_flush_interval
+HEALTH_CHECK_INTERVAL: Final[int] = settings.health_check_interval
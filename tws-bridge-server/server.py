@@ -23,11 +23,14 @@ if os.environ.get("DEBUG_ENABLED") == "true":
     except Exception as e:
         print(f"⚠️  Failed to start debugger: {e}")
 
-from fastapi import FastAPI, WebSocket
+import orjson
+import pydantic_core
+from fastapi import FastAPI, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
-from config import settings
+from config import ACCESS_LOG, HOST, LOG_LEVEL, PORT, TWS_HOST, TWS_MARKET_DATA_TYPE, TWS_PORT
+from api.responses import ORJSONResponse
 from api.routes import router
 from api.websocket import handle_websocket
 from tws.connection_manager import initialize_connections, get_http_connection, get_websocket_connection
@@ -36,7 +39,7 @@ import tws.streaming_manager as streaming_manager_module
 
 # Configure logging
 logging.basicConfig(
-    level=getattr(logging, settings.log_level.upper()),
+    level=getattr(logging, LOG_LEVEL.upper()),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.StreamHandler(sys.stdout)
@@ -61,9 +64,10 @@ async def lifespan(app: FastAPI):
     logger.info("=" * 60)
     logger.info("🚀 TWS Bridge Server Starting")
     logger.info("=" * 60)
-    logger.info(f"Server: http://{settings.host}:{settings.port}")
-    logger.info(f"TWS: {settings.tws_host}:{settings.tws_port}")
-    logger.info(f"Market Data Type: {settings.tws_market_data_type}")
+    logger.info(f"Server: http://{HOST}:{PORT}")
+    logger.info(f"TWS: {TWS_HOST}:{TWS_PORT}")
+    logger.info(f"Market Data Type: {TWS_MARKET_DATA_TYPE}")
+    logger.info(f"pydantic-core: {pydantic_core.__version__}")
     logger.info("=" * 60)
 
     # Initialize TWS connections (HTTP and WebSocket with separate Client IDs)
@@ -128,6 +132,7 @@ app = FastAPI(
     title="TWS Bridge Server",
     description="HTTP API bridge for Interactive Brokers TWS API",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -145,21 +150,25 @@ app.add_middleware(
 app.include_router(router, prefix="/api/v1")
 
 
+# Root payload never changes, so serialize it once at import
+_ROOT_JSON = orjson.dumps({
+    "service": "TWS Bridge Server",
+    "version": "1.0.0",
+    "status": "running",
+    "endpoints": {
+        "health": "/api/v1/health",
+        "bars": "/api/v1/bars",
+        "connect": "/api/v1/connect",
+        "disconnect": "/api/v1/disconnect",
+        "streaming": "ws://localhost:3003/ws/stream"
+    }
+})
+
+
 @app.get("/")
 async def root():
     """Root endpoint."""
-    return {
-        "service": "TWS Bridge Server",
-        "version": "1.0.0",
-        "status": "running",
-        "endpoints": {
-            "health": "/api/v1/health",
-            "bars": "/api/v1/bars",
-            "connect": "/api/v1/connect",
-            "disconnect": "/api/v1/disconnect",
-            "streaming": "ws://localhost:3003/ws/stream"
-        }
-    }
+    return Response(content=_ROOT_JSON, media_type="application/json")
 
 
 @app.websocket("/ws/stream")
@@ -184,10 +193,10 @@ def main():
     try:
         uvicorn.run(
             "server:app",
-            host=settings.host,
-            port=settings.port,
-            log_level=settings.log_level.lower(),
-            access_log=True
+            host=HOST,
+            port=PORT,
+            log_level=LOG_LEVEL.lower(),
+            access_log=ACCESS_LOG
         )
     except KeyboardInterrupt:
         logger.info("🛑 Received shutdown signal")
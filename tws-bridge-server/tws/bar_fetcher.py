@@ -1,23 +1,83 @@
 """Bar fetching logic with real-time streaming support."""
 
+import asyncio
 import logging
 import threading
-from datetime import datetime
-from zoneinfo import ZoneInfo
-from typing import List, Optional, Dict, Any
+from concurrent.futures import Future, InvalidStateError, TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import List, Dict, Any, FrozenSet, Iterable, Optional, Union
 from ibapi.contract import Contract
 from ibapi.wrapper import EWrapper
 
 from tws.connection_manager import get_http_connection
-from config import settings
+from config import BAR_FETCH_TIMEOUT, EMIT_ISO_TIMESTAMPS
 
 logger = logging.getLogger(__name__)
 
+_UTC = timezone.utc
+
+# Number of in-flight bar requests BarFetcherWrapper can track (power of two)
+_REQUEST_SLOTS = 4096
+_REQUEST_SLOT_MASK = _REQUEST_SLOTS - 1
+
+# Informational TWS codes that must not fail a bar request
+# (2104/2106 = data farm OK, 2158 = HMDS OK, 2174/2176 = warnings)
+_INFO_CODES: FrozenSet[int] = frozenset({2104, 2106, 2158, 2174, 2176})
+
+# Period -> TWS barSizeSetting
+_BAR_SIZE_MAP: Dict[str, str] = {
+    "1m": "1 min",
+    "2m": "2 mins",
+    "3m": "3 mins",
+    "5m": "5 mins",
+    "10m": "10 mins",
+    "15m": "15 mins",
+    "30m": "30 mins",
+    "1h": "1 hour",
+    "2h": "2 hours",
+    "4h": "4 hours",
+    "1d": "1 day",
+    "1w": "1 week",
+    "1M": "1 month"
+}
+
+
+def _ibkr_to_iso_local(date_str: str) -> str:
+    """Reshape an IBKR "yyyyMMdd[  HH:mm:ss]" string into "yyyy-MM-ddTHH:mm:ss"."""
+    # Split date and time parts
+    parts = date_str.split()
+    date_part = parts[0]  # "20260126"
+    time_part = parts[1] if len(parts) > 1 else "00:00:00"
+    return f"{date_part[0:4]}-{date_part[4:6]}-{date_part[6:8]}T{time_part}"
+
+
+def _parse_ibkr_local(date_str: str) -> datetime:
+    """Parse an IBKR "yyyyMMdd[  HH:mm:ss]" string into a naive local datetime."""
+    # Reshape into ISO form so the C-implemented fromisoformat does the parsing
+    return datetime.fromisoformat(_ibkr_to_iso_local(date_str))
+
+
+@lru_cache(maxsize=1 << 12)
+def _local_utc_offset(local_hour: str) -> timedelta:
+    """
+    UTC offset of the process's local timezone for one local hour.
+
+    Keyed by "yyyy-MM-ddTHH": the offset only changes on DST transitions,
+    which happen on the hour, so every bar inside the hour shares it.
+    """
+    return datetime.fromisoformat(f"{local_hour}:00:00").astimezone().utcoffset()
 
+
+@lru_cache(maxsize=1 << 16)
 def parse_ibkr_date_to_utc(date_str: str) -> str:
     """
     Parse IBKR date format (local server time) and convert to UTC ISO format.
 
+    Results are memoized: bar timestamps repeat across overlapping fetches and
+    forming-bar updates. Call parse_ibkr_date_to_utc.cache_clear() if the
+    process timezone changes at runtime (and _local_utc_offset.cache_clear()).
+
     IMPORTANT: TWS returns timestamps in the SERVER'S LOCAL TIMEZONE, not Eastern Time!
     - Format: "20260126  09:55:00" (note: two spaces between date and time)
     - If server is in Pacific Time: represents 9:55 AM Pacific (12:55 PM ET)
@@ -27,28 +87,37 @@ def parse_ibkr_date_to_utc(date_str: str) -> str:
     - ISO 8601 UTC string: "2026-01-26T14:55:00+00:00"
     """
     try:
-        # Split date and time parts
-        parts = date_str.split()
-        date_part = parts[0]  # "20260126"
-        time_part = parts[1] if len(parts) > 1 else "00:00:00"
-
-        # Parse components
-        year = int(date_part[0:4])
-        month = int(date_part[4:6])
-        day = int(date_part[6:8])
-        hour, minute, second = [int(x) for x in time_part.split(':')]
-
-        # CRITICAL FIX: Create datetime in LOCAL time (server's timezone)
-        # TWS returns timestamps in the server's local timezone, not Eastern Time!
-        # Get system's local timezone
-        local_tz = datetime.now().astimezone().tzinfo
-        local_time = datetime(year, month, day, hour, minute, second, tzinfo=local_tz)
+        local_iso = _ibkr_to_iso_local(date_str)
 
-        # Convert to UTC
-        utc_time = local_time.astimezone(ZoneInfo('UTC'))
+        # CRITICAL FIX: Interpret the timestamp in LOCAL time (server's timezone)
+        # TWS returns timestamps in the server's local timezone, not Eastern Time!
+        # The local offset is resolved once per hour (DST-correct) and shifted
+        # out directly, instead of building an aware datetime per bar
+        utc_time = datetime.fromisoformat(local_iso) - _local_utc_offset(local_iso[:13])
 
         # Return ISO format
-        return utc_time.isoformat()
+        return utc_time.isoformat() + "+00:00"
+
+    except Exception as e:
+        logger.error(f"Failed to parse IBKR date '{date_str}': {e}")
+        # Return original if parsing fails
+        return date_str
+
+
+@lru_cache(maxsize=1 << 16)
+def parse_ibkr_date_to_epoch_ms(date_str: str) -> Union[int, str]:
+    """
+    Parse IBKR date format (local server time) into UTC epoch milliseconds.
+
+    Same input and caching rules as parse_ibkr_date_to_utc, but skips building
+    an aware datetime and formatting an ISO string.
+
+    Returns:
+    - Epoch milliseconds: 1769439300000 for "20260126  09:55:00" US/Eastern
+    """
+    try:
+        # timestamp() on a naive datetime resolves the local UTC offset (DST-correct)
+        return int(_parse_ibkr_local(date_str).timestamp()) * 1000
 
     except Exception as e:
         logger.error(f"Failed to parse IBKR date '{date_str}': {e}")
@@ -56,9 +125,15 @@ def parse_ibkr_date_to_utc(date_str: str) -> str:
         return date_str
 
 
+# Date conversion used by BarData.to_dict, chosen once from settings
+_convert_bar_date = parse_ibkr_date_to_utc if EMIT_ISO_TIMESTAMPS else parse_ibkr_date_to_epoch_ms
+
+
 class BarData:
     """Represents a single OHLCV bar."""
 
+    __slots__ = ("date", "open", "high", "low", "close", "volume", "wap", "count")
+
     def __init__(self, date: str, open: float, high: float, low: float,
                  close: float, volume: int, wap: float, count: int):
         self.date = date
@@ -71,9 +146,9 @@ class BarData:
         self.count = count
 
     def to_dict(self) -> Dict[str, Any]:
-        """Convert to dictionary with UTC timestamps."""
+        """Convert to dictionary with UTC timestamps (ISO string or epoch ms)."""
         return {
-            "date": parse_ibkr_date_to_utc(self.date),  # Convert local time to UTC
+            "date": _convert_bar_date(self.date),  # Convert local time to UTC
             "open": self.open,
             "high": self.high,
             "low": self.low,
@@ -84,42 +159,86 @@ class BarData:
         }
 
 
+def ibkr_bar_to_dict(bar) -> Dict[str, Any]:
+    """
+    Convert an ibapi BarData straight to the dict BarData.to_dict produces.
+
+    For callers that only need the dict, this skips building a BarData first.
+    """
+    # ibapi 9.x decodes volume as int; 10.x uses Decimal, which orjson can't encode
+    volume = bar.volume
+    return {
+        "date": _convert_bar_date(bar.date),  # Convert local time to UTC
+        "open": bar.open,
+        "high": bar.high,
+        "low": bar.low,
+        "close": bar.close,
+        "volume": volume if type(volume) is int else int(volume),
+        "wap": bar.average,
+        "count": bar.barCount
+    }
+
+
 class BarFetchRequest:
-    """Manages a single bar fetch request."""
+    """
+    Manages a single bar fetch request.
+
+    Bars are only ever written from the TWS API thread (callbacks are
+    serialized there), and the fetching thread reads them after completion,
+    so the bar list needs no lock.
+    """
 
     def __init__(self, req_id: int, include_forming: bool = False):
         self.req_id = req_id
         self.include_forming = include_forming
         self.bars: List[BarData] = []
-        self.is_complete = threading.Event()
-        self.error: Optional[str] = None
-        self.lock = threading.Lock()
+        # Resolves with the bar list on completion, or a RuntimeError on failure
+        self._future: Future = Future()
 
     def add_bar(self, bar: BarData):
         """Add a bar to the result."""
-        with self.lock:
-            self.bars.append(bar)
+        self.bars.append(bar)
 
     def update_last_bar(self, bar: BarData):
         """Update the last (forming) bar."""
-        with self.lock:
-            if self.bars:
-                self.bars[-1] = bar
-            else:
-                self.bars.append(bar)
+        try:
+            self.bars[-1] = bar
+        except IndexError:
+            self.bars.append(bar)
 
     def mark_complete(self):
         """Mark request as complete."""
-        self.is_complete.set()
+        # The event loop may cancel the future on timeout at any moment, so
+        # don't check-then-set from this (TWS reader) thread
+        try:
+            self._future.set_result(self.bars)
+        except InvalidStateError:
+            pass
 
     def mark_error(self, error: str):
         """Mark request as failed."""
-        self.error = error
-        self.is_complete.set()
+        try:
+            self._future.set_exception(RuntimeError(f"Bar fetch failed: {error}"))
+        except InvalidStateError:
+            pass
 
-    def wait(self, timeout: float) -> bool:
-        """Wait for request completion."""
-        return self.is_complete.wait(timeout=timeout)
+    @property
+    def future(self) -> Future:
+        """Future resolved with the bar list when the request completes."""
+        return self._future
+
+    def wait(self, timeout: float) -> List[BarData]:
+        """
+        Wait for request completion and return the bars.
+
+        Raises:
+            TimeoutError: If the request does not complete in time
+            RuntimeError: If TWS reported an error for the request
+        """
+        try:
+            return self._future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"Bar fetch timeout after {timeout}s")
 
 
 class BarFetcherWrapper(EWrapper):
@@ -130,26 +249,41 @@ class BarFetcherWrapper(EWrapper):
         self.base_wrapper = base_wrapper
         # Save original error method before we replace it
         self.original_error = base_wrapper.error
-        self.requests: Dict[int, BarFetchRequest] = {}
+        # In-flight requests live in a fixed ring of slots indexed by the low
+        # bits of reqId. Request IDs are handed out sequentially, so live
+        # requests never share a slot unless _REQUEST_SLOTS are in flight at once.
+        # Callbacks read slots without the lock; the lock only serializes
+        # register/unregister
+        self._slots: List[Optional[BarFetchRequest]] = [None] * _REQUEST_SLOTS
         self.requests_lock = threading.Lock()
 
+    def _lookup(self, req_id: int) -> Optional[BarFetchRequest]:
+        """Return the in-flight request for req_id, if any."""
+        request = self._slots[req_id & _REQUEST_SLOT_MASK]
+        if request is not None and request.req_id == req_id:
+            return request
+        return None
+
     def register_request(self, req_id: int, request: BarFetchRequest):
         """Register a bar fetch request."""
+        slot = req_id & _REQUEST_SLOT_MASK
         with self.requests_lock:
-            self.requests[req_id] = request
-            logger.debug(f"📝 Registered bar fetch request {req_id}")
+            if self._slots[slot] is not None:
+                raise RuntimeError(f"Too many in-flight bar fetch requests (max {_REQUEST_SLOTS})")
+            self._slots[slot] = request
+            logger.debug("📝 Registered bar fetch request %s", req_id)
 
     def unregister_request(self, req_id: int):
         """Unregister a bar fetch request."""
+        slot = req_id & _REQUEST_SLOT_MASK
         with self.requests_lock:
-            if req_id in self.requests:
-                del self.requests[req_id]
-                logger.debug(f"🗑️  Unregistered bar fetch request {req_id}")
+            if self._lookup(req_id) is not None:
+                self._slots[slot] = None
+                logger.debug("🗑️  Unregistered bar fetch request %s", req_id)
 
     def historicalData(self, reqId: int, bar):
         """Callback for historical bar data."""
-        with self.requests_lock:
-            request = self.requests.get(reqId)
+        request = self._lookup(reqId)
 
         if request:
             bar_data = BarData(
@@ -158,17 +292,20 @@ class BarFetcherWrapper(EWrapper):
                 high=bar.high,
                 low=bar.low,
                 close=bar.close,
-                volume=int(bar.volume),
+                volume=bar.volume if type(bar.volume) is int else int(bar.volume),
                 wap=bar.average,
                 count=bar.barCount
             )
             request.add_bar(bar_data)
-            logger.debug(f"📊 Historical bar for reqId={reqId}: {bar.date} | C=${bar.close:.2f} | V={int(bar.volume)}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "📊 Historical bar for reqId=%s: %s | C=$%.2f | V=%d",
+                    reqId, bar_data.date, bar_data.close, bar_data.volume
+                )
 
     def historicalDataEnd(self, reqId: int, start: str, end: str):
         """Callback when historical data is complete."""
-        with self.requests_lock:
-            request = self.requests.get(reqId)
+        request = self._lookup(reqId)
 
         if request:
             logger.info(f"✅ Historical data complete for reqId={reqId}: {len(request.bars)} bars")
@@ -176,10 +313,7 @@ class BarFetcherWrapper(EWrapper):
 
     def historicalDataUpdate(self, reqId: int, bar):
         """Callback for real-time bar updates (forming bar)."""
-        # DEBUG: Log ALL historicalDataUpdate calls
-        logger.info(f"🔔 historicalDataUpdate CALLED: reqId={reqId}, date={bar.date}")
-        with self.requests_lock:
-            request = self.requests.get(reqId)
+        request = self._lookup(reqId)
 
         if request and request.include_forming:
             bar_data = BarData(
@@ -188,12 +322,16 @@ class BarFetcherWrapper(EWrapper):
                 high=bar.high,
                 low=bar.low,
                 close=bar.close,
-                volume=int(bar.volume),
+                volume=bar.volume if type(bar.volume) is int else int(bar.volume),
                 wap=bar.average,
                 count=bar.barCount
             )
             request.update_last_bar(bar_data)
-            logger.debug(f"🔄 Real-time bar update for reqId={reqId}: {bar.date} | C=${bar.close:.2f} | V={int(bar.volume)}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "🔄 Real-time bar update for reqId=%s: %s | C=$%.2f | V=%d",
+                    reqId, bar_data.date, bar_data.close, bar_data.volume
+                )
 
     def error(self, reqId: int, errorCode: int, errorString: str, advancedOrderRejectJson=""):
         """Error callback - delegate to base wrapper and handle request errors."""
@@ -205,11 +343,9 @@ class BarFetcherWrapper(EWrapper):
 
         # Handle request-specific errors
         if reqId > 0:
-            with self.requests_lock:
-                request = self.requests.get(reqId)
+            request = self._lookup(reqId)
 
-            if request and errorCode not in [2104, 2106, 2158, 2174, 2176]:
-                # Not informational messages (2104/2106 = data farm OK, 2158 = HMDS OK, 2174/2176 = warnings)
+            if request and errorCode not in _INFO_CODES:
                 error_msg = f"[{errorCode}] {errorString}"
                 logger.error(f"❌ Error for bar fetch reqId={reqId}: {error_msg}")
                 request.mark_error(error_msg)
@@ -244,7 +380,7 @@ class BarFetcher:
         end_datetime: str = ""
     ) -> List[Dict[str, Any]]:
         """
-        Fetch historical bars from TWS.
+        Fetch historical bars from TWS, blocking the calling thread.
 
         Args:
             symbol: Stock symbol (e.g., "AAPL")
@@ -258,6 +394,75 @@ class BarFetcher:
         Returns:
             List of bar dictionaries
         """
+        request = self._submit(symbol, period, duration, what, session, include_forming, end_datetime)
+
+        try:
+            # Wait for completion
+            bar_list = request.wait(timeout=BAR_FETCH_TIMEOUT)
+            return self._to_dicts(symbol, bar_list)
+        finally:
+            self._release(request)
+
+    async def fetch_bars_async(
+        self,
+        symbol: str,
+        period: str,
+        duration: str,
+        what: str = "TRADES",
+        session: str = "rth",
+        include_forming: bool = False,
+        end_datetime: str = ""
+    ) -> List[Dict[str, Any]]:
+        """
+        Fetch historical bars from TWS without blocking the event loop.
+
+        Takes the same arguments as fetch_bars. Several calls can be awaited
+        together (see fetch_bars_for_symbols_async) so their TWS round trips
+        overlap instead of running back to back.
+        """
+        request = self._submit(symbol, period, duration, what, session, include_forming, end_datetime)
+
+        try:
+            bar_list = await asyncio.wait_for(
+                asyncio.wrap_future(request.future),
+                timeout=BAR_FETCH_TIMEOUT
+            )
+            return self._to_dicts(symbol, bar_list)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Bar fetch timeout after {BAR_FETCH_TIMEOUT}s")
+        finally:
+            self._release(request)
+
+    async def fetch_bars_for_symbols_async(
+        self,
+        symbols: Iterable[str],
+        period: str,
+        duration: str,
+        **kwargs: Any
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Fetch bars for several symbols concurrently.
+
+        Returns:
+            Dict mapping each symbol to its list of bar dictionaries
+        """
+        symbols = list(symbols)
+        results = await asyncio.gather(
+            *(self.fetch_bars_async(symbol, period, duration, **kwargs) for symbol in symbols)
+        )
+        return dict(zip(symbols, results))
+
+    def _submit(
+        self,
+        symbol: str,
+        period: str,
+        duration: str,
+        what: str,
+        session: str,
+        include_forming: bool,
+        end_datetime: str
+    ) -> BarFetchRequest:
+        """Register a bar request and send it to TWS."""
         if not self.tws_connection.is_connected():
             raise RuntimeError("[HTTP] Not connected to TWS")
 
@@ -272,22 +477,7 @@ class BarFetcher:
         contract.currency = "USD"
 
         # Map period to TWS bar size
-        bar_size_map = {
-            "1m": "1 min",
-            "2m": "2 mins",
-            "3m": "3 mins",
-            "5m": "5 mins",
-            "10m": "10 mins",
-            "15m": "15 mins",
-            "30m": "30 mins",
-            "1h": "1 hour",
-            "2h": "2 hours",
-            "4h": "4 hours",
-            "1d": "1 day",
-            "1w": "1 week",
-            "1M": "1 month"
-        }
-        bar_size = bar_size_map.get(period)
+        bar_size = _BAR_SIZE_MAP.get(period)
         if not bar_size:
             raise ValueError(f"Unsupported period: {period}")
 
@@ -324,27 +514,24 @@ class BarFetcher:
                 keepUpToDate=include_forming,  # Stream real-time updates if True
                 chartOptions=[]
             )
-
-            # Wait for completion
-            completed = request.wait(timeout=settings.bar_fetch_timeout)
-
-            if not completed:
-                raise TimeoutError(f"Bar fetch timeout after {settings.bar_fetch_timeout}s")
-
-            if request.error:
-                raise RuntimeError(f"Bar fetch failed: {request.error}")
-
-            bars = [bar.to_dict() for bar in request.bars]
-            logger.info(f"✅ Fetched {len(bars)} bars for {symbol}")
-
-            return bars
-
-        finally:
-            # Cleanup
-            if include_forming:
-                # Cancel real-time updates
-                self.tws_connection.client.cancelHistoricalData(req_id)
-            self.wrapper.unregister_request(req_id)
+        except Exception:
+            self._release(request)
+            raise
+
+        return request
+
+    def _release(self, request: BarFetchRequest):
+        """Cleanup after a bar request has finished, failed or timed out."""
+        if request.include_forming:
+            # Cancel real-time updates
+            self.tws_connection.client.cancelHistoricalData(request.req_id)
+        self.wrapper.unregister_request(request.req_id)
+
+    @staticmethod
+    def _to_dicts(symbol: str, bar_list: List[BarData]) -> List[Dict[str, Any]]:
+        bars = [bar.to_dict() for bar in bar_list]
+        logger.info(f"✅ Fetched {len(bars)} bars for {symbol}")
+        return bars
 
     def cancel_streaming(self, req_id: int):
         """Cancel real-time bar streaming."""
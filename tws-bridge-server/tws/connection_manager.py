@@ -1,17 +1,27 @@
 """TWS connection manager with support for multiple independent connections."""
 
+import itertools
 import logging
+import random
 import threading
-import time
-from typing import Optional
+from typing import FrozenSet, Optional
 from ibapi.client import EClient
 from ibapi.wrapper import EWrapper
 from ibapi.contract import Contract
 
-from config import settings
+from config import HEALTH_CHECK_INTERVAL, TWS_CONNECT_TIMEOUT, TWS_HOST, TWS_MARKET_DATA_TYPE, TWS_PORT
 
 logger = logging.getLogger(__name__)
 
+# 502 = couldn't connect, 504 = not connected, 1100 = connectivity lost,
+# 1300 = socket port reset
+_CONNECTION_ERROR_CODES: FrozenSet[int] = frozenset({502, 504, 1100, 1300})
+
+# Delay between failed reconnect attempts doubles from min to max (seconds),
+# scaled by a random 0.5-1.5x jitter so several clients don't retry in lockstep
+_RECONNECT_BACKOFF_MIN = 1.0
+_RECONNECT_BACKOFF_MAX = 60.0
+
 
 class TWSWrapper(EWrapper):
     """TWS API event wrapper."""
@@ -20,39 +30,48 @@ class TWSWrapper(EWrapper):
         super().__init__()
         self.name = name
         self.next_valid_id: Optional[int] = None
+        # Plain flag for hot-path checks; the condition is only used to block
+        # in connect() until nextValidId arrives
         self.is_connected: bool = False
-        self.connection_event = threading.Event()
+        self._connected_cond = threading.Condition()
+        # Set whenever TWS reports the connection dropped, to wake the reconnect monitor
+        self.disconnect_event = threading.Event()
 
     def nextValidId(self, orderId: int):
         """Callback when connection is established."""
         super().nextValidId(orderId)
         self.next_valid_id = orderId
-        self.is_connected = True
-        self.connection_event.set()
+        with self._connected_cond:
+            self.is_connected = True
+            self._connected_cond.notify_all()
         logger.info(f"✅ [{self.name}] TWS connected, next valid order ID: {orderId}")
 
     def error(self, reqId: int, errorCode: int, errorString: str, advancedOrderRejectJson=""):
         """Error callback."""
+        # Informational codes (2000+: data farm status, warnings) are the bulk of
+        # this traffic; log and return without the base class's ERROR-level log
+        if errorCode >= 2000:
+            if errorCode == 2104:
+                # Market data farm connection OK
+                logger.debug("[%s] TWS: %s", self.name, errorString)
+            elif errorCode == 2106:
+                # Historical data farm connection OK
+                logger.debug("[%s] TWS: %s", self.name, errorString)
+            else:
+                # Informational messages
+                logger.debug("[%s] TWS info [%s]: %s", self.name, errorCode, errorString)
+            return
+
         try:
             super().error(reqId, errorCode, errorString, advancedOrderRejectJson)
         except TypeError:
             # Older ibapi versions don't have advancedOrderRejectJson parameter
             super().error(reqId, errorCode, errorString)
 
-        # 502 = connection lost, 504 = not connected
-        if errorCode in [502, 504, 1100, 1300]:
+        if errorCode in _CONNECTION_ERROR_CODES:
             logger.error(f"❌ [{self.name}] TWS connection error: [{errorCode}] {errorString}")
             self.is_connected = False
-            self.connection_event.clear()
-        elif errorCode == 2104:
-            # Market data farm connection OK
-            logger.debug(f"[{self.name}] TWS: {errorString}")
-        elif errorCode == 2106:
-            # Historical data farm connection OK
-            logger.debug(f"[{self.name}] TWS: {errorString}")
-        elif errorCode >= 2000:
-            # Informational messages
-            logger.debug(f"[{self.name}] TWS info [{errorCode}]: {errorString}")
+            self.disconnect_event.set()
         else:
             logger.warning(f"[{self.name}] TWS error for reqId={reqId}: [{errorCode}] {errorString}")
 
@@ -60,9 +79,14 @@ class TWSWrapper(EWrapper):
         """Connection closed callback."""
         super().connectionClosed()
         self.is_connected = False
-        self.connection_event.clear()
+        self.disconnect_event.set()
         logger.warning(f"⚠️  [{self.name}] TWS connection closed")
 
+    def wait_connected(self, timeout: float) -> bool:
+        """Block until nextValidId marks the connection ready, or timeout."""
+        with self._connected_cond:
+            return self._connected_cond.wait_for(lambda: self.is_connected, timeout=timeout)
+
 
 class TWSClient(EClient):
     """Extended TWS client with additional utilities."""
@@ -91,36 +115,51 @@ class TWSConnectionManager:
         self.client_id = client_id
         self.wrapper = TWSWrapper(name)
         self.client = TWSClient(self.wrapper)
+        self._client_is_connected = self.client.isConnected  # bound once for is_connected()
         self._api_thread: Optional[threading.Thread] = None
         self._reconnect_thread: Optional[threading.Thread] = None
         self._should_stop = threading.Event()
-        self._request_id_counter = request_id_start
-        self._request_id_lock = threading.Lock()
+        # count.__next__ runs in C and is atomic under the GIL, so no lock is needed
+        self._next_request_id = itertools.count(request_id_start).__next__
 
         logger.info(f"🔧 [{name}] TWS Connection Manager initialized (Client ID: {client_id})")
 
-    def connect(self) -> bool:
-        """Connect to TWS/IB Gateway."""
+    def connect(self, clear_stop: bool = True) -> bool:
+        """
+        Connect to TWS/IB Gateway.
+
+        Args:
+            clear_stop: Cancel an earlier disconnect() request. The reconnect
+                monitor passes False so a concurrent shutdown still wins.
+        """
         # Check if truly connected (both client socket and wrapper state)
-        if self.client.isConnected() and self.wrapper.is_connected:
+        if self.is_connected():
             logger.debug(f"[{self.name}] Already connected to TWS")
             return True
 
+        # A user-initiated connect() cancels any earlier disconnect() request,
+        # so the waits below and the reconnect monitor run normally again
+        if clear_stop:
+            self._should_stop.clear()
+
         # If client thinks it's connected but wrapper doesn't, force disconnect
         if self.client.isConnected() and not self.wrapper.is_connected:
             logger.warning(f"⚠️  [{self.name}] Client connected but wrapper disconnected, forcing cleanup...")
             try:
                 self.client.disconnect()
-                time.sleep(1)
+                self._should_stop.wait(timeout=1)
             except Exception as e:
                 logger.debug(f"[{self.name}] Cleanup disconnect error: {e}")
 
+        # Only a fresh nextValidId from this handshake counts as connected
+        self.wrapper.is_connected = False
+
         try:
-            logger.info(f"🔌 [{self.name}] Connecting to TWS at {settings.tws_host}:{settings.tws_port} (Client ID: {self.client_id})...")
+            logger.info(f"🔌 [{self.name}] Connecting to TWS at {TWS_HOST}:{TWS_PORT} (Client ID: {self.client_id})...")
 
             self.client.connect(
-                settings.tws_host,
-                settings.tws_port,
+                TWS_HOST,
+                TWS_PORT,
                 self.client_id  # Use instance-specific client ID
             )
 
@@ -135,12 +174,12 @@ class TWSConnectionManager:
                 logger.debug(f"✅ [{self.name}] TWS API thread started")
 
             # Wait for connection confirmation
-            connected = self.wrapper.connection_event.wait(timeout=settings.tws_connect_timeout)
+            connected = self.wrapper.wait_connected(timeout=TWS_CONNECT_TIMEOUT)
 
             if connected:
                 # Set market data type (2 = frozen/delayed, free)
-                self.client.reqMarketDataType(settings.tws_market_data_type)
-                logger.info(f"✅ [{self.name}] TWS connected successfully (market data type: {settings.tws_market_data_type})")
+                self.client.reqMarketDataType(TWS_MARKET_DATA_TYPE)
+                logger.info(f"✅ [{self.name}] TWS connected successfully (market data type: {TWS_MARKET_DATA_TYPE})")
 
                 # Start auto-reconnect monitor
                 if self._reconnect_thread is None or not self._reconnect_thread.is_alive():
@@ -154,7 +193,10 @@ class TWSConnectionManager:
                 return True
             else:
                 logger.error(f"❌ [{self.name}] TWS connection timeout")
-                self.disconnect()
+                # Drop the half-open socket without setting _should_stop, so the
+                # reconnect monitor keeps backing off and retrying
+                self.client.disconnect()
+                self.wrapper.is_connected = False
                 return False
 
         except Exception as e:
@@ -165,21 +207,19 @@ class TWSConnectionManager:
         """Disconnect from TWS."""
         logger.info(f"🔌 [{self.name}] Disconnecting from TWS...")
         self._should_stop.set()
+        self.wrapper.disconnect_event.set()
         self.client.disconnect()
         self.wrapper.is_connected = False
-        self.wrapper.connection_event.clear()
         logger.info(f"✅ [{self.name}] TWS disconnected")
 
     def is_connected(self) -> bool:
         """Check if connected to TWS."""
-        return self.client.isConnected() and self.wrapper.is_connected
+        # Cheap wrapper flag first; client.isConnected() formats a debug log line per call
+        return self.wrapper.is_connected and self._client_is_connected()
 
     def get_next_request_id(self) -> int:
         """Get next unique request ID."""
-        with self._request_id_lock:
-            req_id = self._request_id_counter
-            self._request_id_counter += 1
-            return req_id
+        return self._next_request_id()
 
     def _run_api_loop(self):
         """Run the TWS API message processing loop."""
@@ -192,32 +232,51 @@ class TWSConnectionManager:
             logger.info(f"⏸️  [{self.name}] TWS API message loop stopped")
 
     def _reconnect_loop(self):
-        """Monitor connection and auto-reconnect if needed."""
+        """
+        Monitor connection and auto-reconnect if needed.
+
+        While connected this sleeps until TWS reports a disconnect (or
+        HEALTH_CHECK_INTERVAL passes). Failed reconnects back off
+        exponentially from _RECONNECT_BACKOFF_MIN to _RECONNECT_BACKOFF_MAX,
+        with jitter.
+        """
         logger.info(f"🔄 [{self.name}] Starting TWS auto-reconnect monitor...")
+        backoff = _RECONNECT_BACKOFF_MIN
 
         while not self._should_stop.is_set():
             try:
-                if not self.is_connected():
-                    logger.warning(f"⚠️  [{self.name}] TWS connection lost, attempting reconnect...")
-
-                    # Force full disconnect to clean up stale state
-                    try:
-                        self.client.disconnect()
-                        self.wrapper.is_connected = False
-                        self.wrapper.connection_event.clear()
-                        # Wait for socket to fully close
-                        time.sleep(2)
-                    except Exception as e:
-                        logger.debug(f"[{self.name}] Disconnect during reconnect: {e}")
-
-                    # Attempt reconnect
-                    if self.connect():
-                        logger.info(f"✅ [{self.name}] Successfully reconnected to TWS")
-                    else:
-                        logger.error(f"❌ [{self.name}] Reconnect attempt failed, will retry in 10s")
-
-                # Check every 10 seconds
-                self._should_stop.wait(timeout=10)
+                # Clear before checking so a disconnect arriving in between is not missed
+                self.wrapper.disconnect_event.clear()
+
+                if self.is_connected():
+                    backoff = _RECONNECT_BACKOFF_MIN
+                    self.wrapper.disconnect_event.wait(timeout=HEALTH_CHECK_INTERVAL)
+                    continue
+
+                logger.warning(f"⚠️  [{self.name}] TWS connection lost, attempting reconnect...")
+
+                # Force full disconnect to clean up stale state
+                try:
+                    self.client.disconnect()
+                    self.wrapper.is_connected = False
+                    # Wait for socket to fully close (interruptible by shutdown)
+                    self._should_stop.wait(timeout=2)
+                except Exception as e:
+                    logger.debug(f"[{self.name}] Disconnect during reconnect: {e}")
+
+                # disconnect() may have been called during the pause
+                if self._should_stop.is_set():
+                    break
+
+                # Attempt reconnect
+                if self.connect(clear_stop=False):
+                    logger.info(f"✅ [{self.name}] Successfully reconnected to TWS")
+                    backoff = _RECONNECT_BACKOFF_MIN
+                else:
+                    delay = backoff * (0.5 + random.random())
+                    logger.error(f"❌ [{self.name}] Reconnect attempt failed, will retry in {delay:.1f}s")
+                    self._should_stop.wait(timeout=delay)
+                    backoff = min(backoff * 2, _RECONNECT_BACKOFF_MAX)
 
             except Exception as e:
                 logger.error(f"❌ [{self.name}] Reconnect loop error: {e}")
@@ -264,8 +323,3 @@ def get_websocket_connection() -> TWSConnectionManager:
     if websocket_connection is None:
         raise RuntimeError("WebSocket connection not initialized. Call initialize_connections() first.")
     return websocket_connection
-
-
-# DEPRECATED: Legacy singleton instance for backward compatibility
-# This will be removed once all code is migrated to use get_http_connection()
-tws_manager = None  # Will be set to http_connection after initialize_connections()
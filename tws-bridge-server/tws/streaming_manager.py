@@ -3,18 +3,55 @@
 import logging
 import asyncio
 import threading
-from typing import Dict, Set, Optional, Callable
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Set, Optional, Callable, Tuple
 from datetime import datetime
+from functools import lru_cache
+from ibapi.contract import Contract
 
 from tws.connection_manager import get_websocket_connection
-from tws.bar_fetcher import BarData
+from tws.bar_fetcher import ibkr_bar_to_dict
 
 logger = logging.getLogger(__name__)
 
+# Period -> TWS barSizeSetting for the bar sizes supported by streaming
+_BAR_SIZE_MAP: Dict[str, str] = {
+    "1m": "1 min",
+    "5m": "5 mins",
+    "15m": "15 mins",
+    "30m": "30 mins",
+    "1h": "1 hour",
+}
+
+
+@lru_cache(maxsize=1024)
+def _contract_for(symbol: str) -> Contract:
+    """
+    Build the TWS contract for a symbol, memoized across resubscribes.
+
+    reqHistoricalData only reads the contract, so one instance per symbol
+    is shared by every request for it.
+    """
+    # VIX is an index, not a stock - requires special handling
+    is_vix = symbol.upper() == "VIX"
+
+    contract = Contract()
+    contract.symbol = symbol
+    contract.secType = "IND" if is_vix else "STK"
+    contract.exchange = "CBOE" if is_vix else "SMART"
+    contract.currency = "USD"
+    return contract
+
 
 class StreamingSubscription:
     """Manages a single streaming subscription."""
 
+    __slots__ = (
+        "req_id", "symbol", "period", "session", "what", "is_active",
+        "subscribers", "subscriber_count", "last_bar", "update_count", "created_at"
+    )
+
     def __init__(self, req_id: int, symbol: str, period: str, session: str, what: str):
         self.req_id = req_id
         self.symbol = symbol
@@ -23,49 +60,57 @@ class StreamingSubscription:
         self.what = what
         self.is_active = True
         self.subscribers: Set[str] = set()  # WebSocket connection IDs
-        self.last_bar: Optional[BarData] = None
+        self.subscriber_count = 0  # len(subscribers), kept as a plain int for the tick path
+        self.last_bar: Optional[Dict[str, Any]] = None  # Latest bar as sent to callbacks
         self.update_count = 0
-        self.created_at = datetime.now()
+        self.created_at = time.time()  # Epoch seconds; formatted only when listed
 
     def add_subscriber(self, connection_id: str):
         """Add a subscriber to this subscription."""
-        self.subscribers.add(connection_id)
-        logger.info(f"📡 Added subscriber {connection_id} to {self.symbol} stream (total: {len(self.subscribers)})")
+        if connection_id not in self.subscribers:
+            self.subscribers.add(connection_id)
+            self.subscriber_count += 1
+        logger.info("📡 Added subscriber %s to %s stream (total: %d)", connection_id, self.symbol, self.subscriber_count)
 
     def remove_subscriber(self, connection_id: str):
         """Remove a subscriber from this subscription."""
-        if connection_id in self.subscribers:
+        try:
             self.subscribers.remove(connection_id)
-            logger.info(f"📡 Removed subscriber {connection_id} from {self.symbol} stream (remaining: {len(self.subscribers)})")
+        except KeyError:
+            return
+        self.subscriber_count -= 1
+        logger.info(
+            "📡 Removed subscriber %s from %s stream (remaining: %d)",
+            connection_id, self.symbol, self.subscriber_count
+        )
 
     def has_subscribers(self) -> bool:
         """Check if subscription has any active subscribers."""
-        return len(self.subscribers) > 0
+        return self.subscriber_count > 0
 
 
 class StreamingManager:
-    """Manages real-time bar streaming subscriptions."""
+    """
+    Manages real-time bar streaming subscriptions.
 
-    _instance: Optional['StreamingManager'] = None
-    _lock = threading.Lock()
-
-    def __new__(cls):
-        if cls._instance is None:
-            with cls._lock:
-                if cls._instance is None:
-                    cls._instance = super().__new__(cls)
-                    cls._instance._initialized = False
-        return cls._instance
+    One instance is created at server startup (after the WebSocket TWS
+    connection exists) and published as the module-level streaming_manager.
+    """
 
     def __init__(self):
-        if self._initialized:
-            return
-
-        self._initialized = True
         self.subscriptions: Dict[str, StreamingSubscription] = {}  # key: symbol
+        self.subscriptions_by_reqid: Dict[int, StreamingSubscription] = {}  # key: TWS reqId
+        self._connection_symbols: Dict[str, Set[str]] = defaultdict(set)  # key: connection ID
         self.callbacks: Dict[str, Callable] = {}  # key: symbol, value: async callback
         self.lock = threading.Lock()
         self.event_loop = None  # Reference to main event loop for thread-safe task scheduling
+        # Bar updates handed from the TWS thread to the event loop. The TWS thread
+        # appends and wakes _drain_updates at most once per drain; the drain
+        # task runs the callbacks for everything that accumulated
+        self._pending_updates: Deque[Tuple[Callable, str, Dict[str, Any]]] = deque()
+        self._wake: Optional[asyncio.Event] = None
+        self._wake_scheduled = False
+        self._drainer: Optional[asyncio.Task] = None
 
         # Get WebSocket connection
         self.tws_connection = get_websocket_connection()
@@ -79,66 +124,87 @@ class StreamingManager:
 
     def _handle_bar_update(self, reqId: int, bar):
         """Handle real-time bar updates from TWS (called from TWS thread)."""
-        # DEBUG: Log EVERY callback invocation
-        logger.info(f"🔔 _handle_bar_update CALLED: reqId={reqId}, bar.date={bar.date}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🔔 _handle_bar_update CALLED: reqId=%s, bar.date=%s", reqId, bar.date)
         try:
             self._process_bar_update(reqId, bar)
         except Exception as e:
             logger.error(f"❌ Exception in _handle_bar_update: {e}", exc_info=True)
 
     def _process_bar_update(self, reqId: int, bar):
-        """Process bar update with error handling."""
-        with self.lock:
-            # Find subscription by reqId
-            subscription = None
-            for sub in self.subscriptions.values():
-                if sub.req_id == reqId:
-                    subscription = sub
-                    break
-
-            if not subscription:
-                logger.warning(f"⚠️  Received bar update for unknown reqId={reqId}")
-                return
-
-            # Convert to BarData
-            bar_data = BarData(
-                date=bar.date,
-                open=bar.open,
-                high=bar.high,
-                low=bar.low,
-                close=bar.close,
-                volume=int(bar.volume),
-                wap=bar.average,
-                count=bar.barCount
-            )
+        """
+        Process bar update with error handling.
 
-            subscription.last_bar = bar_data
-            subscription.update_count += 1
+        Runs only on the WebSocket connection's TWS reader thread, the single
+        writer of last_bar/update_count, so no lock is taken here. self.lock
+        serializes subscribe/unsubscribe; the dict reads below are atomic
+        under the GIL and at worst see a subscription that was just removed.
+        """
+        # Find subscription by reqId
+        subscription = self.subscriptions_by_reqid.get(reqId)
+
+        if not subscription:
+            logger.warning(f"⚠️  Received bar update for unknown reqId={reqId}")
+            return
+
+        # Last subscriber left and the TWS cancel is still in flight
+        if not subscription.has_subscribers():
+            return
+
+        # Convert once; the same dict is kept as last_bar and handed to the callback
+        bar_dict = ibkr_bar_to_dict(bar)
 
+        subscription.last_bar = bar_dict
+        subscription.update_count += 1
+
+        if logger.isEnabledFor(logging.DEBUG):
             logger.debug(
-                f"🔄 Real-time update for {subscription.symbol}: "
-                f"{bar.date} | C=${bar.close:.2f} | V={int(bar.volume)} | "
-                f"Update #{subscription.update_count}"
+                "🔄 Real-time update for %s: %s | C=$%.2f | V=%d | Update #%d",
+                subscription.symbol, bar.date, bar.close, bar_dict["volume"], subscription.update_count
             )
 
-            # Call async callback if registered
-            if subscription.symbol in self.callbacks and self.event_loop:
-                callback = self.callbacks[subscription.symbol]
-                # Schedule callback in event loop from TWS thread (thread-safe)
+        # Call async callback if registered
+        callback = self.callbacks.get(subscription.symbol)
+        if callback and self.event_loop:
+            # Queue for the drain task; only the first update since the last
+            # drain pays for a cross-thread wake-up
+            self._pending_updates.append((callback, subscription.symbol, bar_dict))
+            if not self._wake_scheduled:
+                self._wake_scheduled = True
                 try:
-                    asyncio.run_coroutine_threadsafe(
-                        callback(subscription.symbol, bar_data.to_dict()),
-                        self.event_loop
-                    )
-                    logger.info(f"✅ Scheduled callback for {subscription.symbol} (update #{subscription.update_count})")
+                    self.event_loop.call_soon_threadsafe(self._wake.set)
                 except Exception as e:
+                    self._wake_scheduled = False
                     logger.error(f"❌ Failed to schedule callback for {subscription.symbol}: {e}")
-            else:
-                # DEBUG: Log why callback wasn't scheduled
-                if subscription.symbol not in self.callbacks:
-                    logger.warning(f"⚠️  No callback registered for {subscription.symbol}")
-                if not self.event_loop:
-                    logger.warning(f"⚠️  Event loop not set")
+                    return
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "✅ Scheduled callback for %s (update #%s)",
+                    subscription.symbol, subscription.update_count
+                )
+        else:
+            # DEBUG: Log why callback wasn't scheduled
+            if not callback:
+                logger.warning(f"⚠️  No callback registered for {subscription.symbol}")
+            if not self.event_loop:
+                logger.warning(f"⚠️  Event loop not set")
+
+    async def _drain_updates(self):
+        """Run bar callbacks for queued updates, in arrival order (event loop task)."""
+        pending = self._pending_updates
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            # Reset before draining: an update appended after this point either
+            # gets drained below or schedules a fresh wake-up
+            self._wake_scheduled = False
+
+            while pending:
+                callback, symbol, bar_dict = pending.popleft()
+                try:
+                    await callback(symbol, bar_dict)
+                except Exception as e:
+                    logger.error(f"❌ Bar callback failed for {symbol}: {e}", exc_info=True)
 
     async def subscribe(
         self,
@@ -165,6 +231,8 @@ class StreamingManager:
         """
         # Capture event loop reference (first time only)
         if self.event_loop is None:
+            self._wake = asyncio.Event()
+            self._drainer = asyncio.create_task(self._drain_updates())
             self.event_loop = asyncio.get_running_loop()
             logger.info(f"📡 Captured event loop reference: {self.event_loop}")
 
@@ -173,43 +241,27 @@ class StreamingManager:
             if symbol in self.subscriptions:
                 subscription = self.subscriptions[symbol]
                 subscription.add_subscriber(connection_id)
+                self._connection_symbols[connection_id].add(symbol)
                 logger.info(
                     f"✅ Reusing existing stream for {symbol} "
-                    f"(subscribers: {len(subscription.subscribers)})"
+                    f"(subscribers: {subscription.subscriber_count})"
                 )
                 return {
                     "status": "subscribed",
                     "symbol": symbol,
                     "req_id": subscription.req_id,
                     "existing": True,
-                    "subscribers": len(subscription.subscribers)
+                    "subscribers": subscription.subscriber_count
                 }
 
         # Create new subscription
         req_id = self.tws_connection.get_next_request_id()
 
-        # Import here to avoid circular dependency
-        from ibapi.contract import Contract
-
         # Create contract
-        # VIX is an index, not a stock - requires special handling
-        is_vix = symbol.upper() == "VIX"
-
-        contract = Contract()
-        contract.symbol = symbol
-        contract.secType = "IND" if is_vix else "STK"
-        contract.exchange = "CBOE" if is_vix else "SMART"
-        contract.currency = "USD"
+        contract = _contract_for(symbol)
 
         # Map period to bar size
-        bar_size_map = {
-            "1m": "1 min",
-            "5m": "5 mins",
-            "15m": "15 mins",
-            "30m": "30 mins",
-            "1h": "1 hour",
-        }
-        bar_size = bar_size_map.get(period)
+        bar_size = _BAR_SIZE_MAP.get(period)
         if not bar_size:
             raise ValueError(f"Unsupported period for streaming: {period}")
 
@@ -245,6 +297,8 @@ class StreamingManager:
 
             with self.lock:
                 self.subscriptions[symbol] = subscription
+                self.subscriptions_by_reqid[req_id] = subscription
+                self._connection_symbols[connection_id].add(symbol)
                 if callback:
                     self.callbacks[symbol] = callback
 
@@ -280,12 +334,14 @@ class StreamingManager:
 
             subscription = self.subscriptions[symbol]
             subscription.remove_subscriber(connection_id)
+            self._discard_connection_symbol(connection_id, symbol)
 
             # If no more subscribers, cancel TWS streaming
             if not subscription.has_subscribers():
                 logger.info(f"🛑 [WebSocket] Cancelling stream for {symbol} (no subscribers)")
                 self.tws_connection.client.cancelHistoricalData(subscription.req_id)
                 del self.subscriptions[symbol]
+                del self.subscriptions_by_reqid[subscription.req_id]
                 if symbol in self.callbacks:
                     del self.callbacks[symbol]
                 return {
@@ -297,7 +353,7 @@ class StreamingManager:
             return {
                 "status": "unsubscribed",
                 "symbol": symbol,
-                "remaining_subscribers": len(subscription.subscribers)
+                "remaining_subscribers": subscription.subscriber_count
             }
 
     async def unsubscribe_all(self, connection_id: str) -> Dict:
@@ -314,9 +370,10 @@ class StreamingManager:
         cancelled = []
 
         with self.lock:
-            for symbol in list(self.subscriptions.keys()):
-                subscription = self.subscriptions[symbol]
-                if connection_id in subscription.subscribers:
+            # Only visit the streams this connection is on, not every stream
+            for symbol in self._connection_symbols.pop(connection_id, ()):
+                subscription = self.subscriptions.get(symbol)
+                if subscription is not None and connection_id in subscription.subscribers:
                     subscription.remove_subscriber(connection_id)
                     unsubscribed.append(symbol)
 
@@ -324,6 +381,7 @@ class StreamingManager:
                         logger.info(f"🛑 [WebSocket] Cancelling stream for {symbol} (no subscribers)")
                         self.tws_connection.client.cancelHistoricalData(subscription.req_id)
                         del self.subscriptions[symbol]
+                        del self.subscriptions_by_reqid[subscription.req_id]
                         if symbol in self.callbacks:
                             del self.callbacks[symbol]
                         cancelled.append(symbol)
@@ -340,6 +398,14 @@ class StreamingManager:
             "cancelled": cancelled
         }
 
+    def _discard_connection_symbol(self, connection_id: str, symbol: str):
+        """Drop symbol from a connection's reverse index (caller holds self.lock)."""
+        symbols = self._connection_symbols.get(connection_id)
+        if symbols is not None:
+            symbols.discard(symbol)
+            if not symbols:
+                del self._connection_symbols[connection_id]
+
     def get_active_subscriptions(self) -> Dict:
         """Get list of active subscriptions."""
         with self.lock:
@@ -349,10 +415,10 @@ class StreamingManager:
                     "period": sub.period,
                     "session": sub.session,
                     "what": sub.what,
-                    "subscribers": len(sub.subscribers),
+                    "subscribers": sub.subscriber_count,
                     "update_count": sub.update_count,
-                    "last_bar": sub.last_bar.to_dict() if sub.last_bar else None,
-                    "created_at": sub.created_at.isoformat()
+                    "last_bar": sub.last_bar,
+                    "created_at": datetime.fromtimestamp(sub.created_at).isoformat()
                 }
                 for symbol, sub in self.subscriptions.items()
             }
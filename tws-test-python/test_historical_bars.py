@@ -3,53 +3,77 @@
 TWS Python API Historical Data Fetching Test
 Tests basic historical bar fetching from TWS
 
+Usage:
+    python3 test_historical_bars.py              # HL only
+    python3 test_historical_bars.py HL SPY XLE   # batch, one request per symbol
+    python3 test_historical_bars.py -q HL SPY    # no per-bar/per-request progress lines
+
 Official TWS API Python package: ibapi
 """
 
 import sys
-import time
+import argparse
 import threading
 from datetime import datetime
-from collections import defaultdict
+from collections import Counter, deque
 
 from ibapi.client import EClient
 from ibapi.wrapper import EWrapper
-from ibapi.contract import Contract
 from ibapi.common import BarData
 
+from tws_common import (
+    INFO_CODES, MARKET_DATA_ERROR_CODES, WrapperErrorMixin, error_event_key, format_bar_date,
+    make_stk_contract, tune_socket
+)
+from tws_common import BLUE, CYAN, GREEN, RED, RESET, YELLOW
+
 # Configuration
 TWS_HOST = "127.0.0.1"
 TWS_PORT = 7497  # Paper trading port (use 7496 for live)
 CLIENT_ID = 9998
-REQUEST_ID = 12346
-TIMEOUT_SECONDS = 30
-
-# ANSI color codes
-RESET = "\033[0m"
-RED = "\033[31m"
-GREEN = "\033[32m"
-YELLOW = "\033[33m"
-BLUE = "\033[34m"
-CYAN = "\033[36m"
+REQUEST_ID = 12346  # First symbol; later symbols use REQUEST_ID + 1, + 2, ...
+TIMEOUT_SECONDS = 30  # Per wave of MAX_PENDING requests
+MAX_PENDING = 10  # Historical requests in flight at once (TWS pacing)
+PRINT_BATCH = 32  # Bar lines buffered per stdout write
 
 
-class TestApp(EWrapper, EClient):
+class TestApp(WrapperErrorMixin, EWrapper, EClient):
     """
     TWS API test application
     Combines EWrapper (callbacks) and EClient (request methods)
     """
 
-    def __init__(self):
+    def __init__(self, symbols=("HL",), quiet=False):
         EClient.__init__(self, self)
 
+        self.quiet = quiet
+
         # State tracking
         self.connected = False
+        self.connected_evt = threading.Event()
+        self.closed_evt = threading.Event()
+        self.done_evt = threading.Event()
         self.data_complete = False
         self.bar_count = 0
-        self.bars_received = []
         self.error_occurred = False
-        self.error_message = None
-        self.event_counts = defaultdict(int)
+        self.error_message = None  # Errors not tied to a request
+        self.event_counts = Counter()
+
+        # Per-request state, keyed by reqId
+        self.requests = {
+            REQUEST_ID + i: {
+                'symbol': symbol,
+                'bar_count': 0,
+                'first': None,  # First and last ibapi BarData, for the summary
+                'last': None,
+                'complete': False,
+                'error': None,
+            }
+            for i, symbol in enumerate(symbols)
+        }
+        self._unsent = deque(self.requests)
+        self._pending = 0
+        self._print_buf = []
 
         # Thread for message processing
         self.msg_thread = None
@@ -58,6 +82,7 @@ class TestApp(EWrapper, EClient):
         """Connect to TWS and start message loop"""
         print(f"{CYAN}🔌 Connecting to TWS at {TWS_HOST}:{TWS_PORT}...{RESET}")
         self.connect(TWS_HOST, TWS_PORT, CLIENT_ID)
+        tune_socket(self)
 
         # Start message processing thread
         self.msg_thread = threading.Thread(target=self.run, daemon=True)
@@ -76,7 +101,18 @@ class TestApp(EWrapper, EClient):
         print()
 
         # Request historical data after connection
-        self.request_historical_data()
+        print(f"{BLUE}📡 Requesting historical data...{RESET}")
+        print(f"   Symbols: {', '.join(req['symbol'] for req in self.requests.values())}")
+        print(f"   Bar Size: 5 mins")
+        print(f"   Duration: 1 D")
+        print(f"   Session: Regular Trading Hours (RTH)")
+        print(f"   What: TRADES")
+        print(f"   End DateTime: Current time (empty string)")
+        print()
+        self.send_requests()
+        print(f"{YELLOW}⏳ Waiting for historical data (timeout: {TIMEOUT_SECONDS}s per "
+              f"{MAX_PENDING} requests)...{RESET}")
+        self.connected_evt.set()
 
     def connectAck(self):
         """Connection acknowledged"""
@@ -89,138 +125,154 @@ class TestApp(EWrapper, EClient):
         self.event_counts['connectionClosed'] += 1
         print(f"{YELLOW}⚠️  Connection closed{RESET}")
         self.connected = False
+        self.closed_evt.set()
 
     # ==================== Historical Data Request ====================
 
-    def request_historical_data(self):
-        """Request historical data for HL (5-minute bars, 1 day)"""
-        print(f"{BLUE}📡 Requesting historical data...{RESET}")
+    def send_requests(self):
+        """Issue queued requests until MAX_PENDING are in flight"""
+        while self._unsent and self._pending < MAX_PENDING:
+            self._pending += 1
+            req_id = self._unsent.popleft()
+            self.request_historical_data(req_id, self.requests[req_id]['symbol'])
 
-        # Create HL stock contract (the symbol from your error logs)
-        contract = Contract()
-        contract.symbol = "HL"
-        contract.secType = "STK"
-        contract.exchange = "SMART"
-        contract.currency = "USD"
+    def request_historical_data(self, req_id: int, symbol: str):
+        """Request historical data for one symbol (5-minute bars, 1 day)"""
+        contract = make_stk_contract(symbol)
 
-        print(f"   Contract: {contract.symbol} {contract.secType}")
-        print(f"   Request ID: {REQUEST_ID}")
-        print(f"   Bar Size: 5 mins")
-        print(f"   Duration: 1 D")
-        print(f"   Session: Regular Trading Hours (RTH)")
-        print(f"   What: TRADES")
-        print(f"   End DateTime: Current time (empty string)")
-        print()
+        if not self.quiet:
+            print(f"   Contract: {contract.symbol} {contract.secType} (Request ID: {req_id})")
 
         # Request historical data
         self.reqHistoricalData(
-            reqId=REQUEST_ID,
+            reqId=req_id,
             contract=contract,
             endDateTime="",         # Empty string = current time
             durationStr="1 D",      # 1 day of data
             barSizeSetting="5 mins",  # 5-minute bars
             whatToShow="TRADES",    # Trade data
             useRTH=1,               # Regular trading hours only
-            formatDate=1,           # Format: yyyymmdd  hh:mm:ss
+            formatDate=2,           # Format: epoch seconds
             keepUpToDate=False,     # No real-time streaming
             chartOptions=[]
         )
 
-        print(f"{YELLOW}⏳ Waiting for historical data (timeout: {TIMEOUT_SECONDS}s)...{RESET}")
+    def finish_request(self, req_id: int):
+        """Free a pending slot, issue the next request, signal when all are done"""
+        self._pending -= 1
+        self.send_requests()
+        if not self._pending and not self._unsent:
+            self.data_complete = all(req['complete'] for req in self.requests.values())
+            self.done_evt.set()
 
     # ==================== Historical Data Callbacks ====================
 
     def historicalData(self, reqId: int, bar: BarData):
         """Called for each historical bar"""
-        super().historicalData(reqId, bar)
-
-        if reqId != REQUEST_ID:
+        req = self.requests.get(reqId)
+        if req is None:
             return
 
         self.event_counts['historicalData'] += 1
         self.bar_count += 1
-        self.bars_received.append({
-            'date': bar.date,
-            'open': bar.open,
-            'high': bar.high,
-            'low': bar.low,
-            'close': bar.close,
-            'volume': int(bar.volume),
-            'wap': bar.average,
-            'count': bar.barCount
-        })
+        req['bar_count'] = count = req['bar_count'] + 1
+        if count == 1:
+            req['first'] = bar
+        req['last'] = bar
 
         # Print first 5 bars, then every 10th
-        if self.bar_count <= 5 or self.bar_count % 10 == 0:
-            print(f"   Bar {self.bar_count}: {bar.date} | "
-                  f"O: ${bar.open:.2f} | H: ${bar.high:.2f} | "
-                  f"L: ${bar.low:.2f} | C: ${bar.close:.2f} | "
-                  f"Vol: {int(bar.volume)}")
+        if not self.quiet and (count <= 5 or count % 10 == 0):
+            self._print_buf.append(
+                f"   {req['symbol']} Bar {count}: {format_bar_date(bar.date)} | "
+                f"O: ${bar.open:.2f} | H: ${bar.high:.2f} | "
+                f"L: ${bar.low:.2f} | C: ${bar.close:.2f} | "
+                f"Vol: {bar.volume}")
+            if len(self._print_buf) >= PRINT_BATCH:
+                self.flush_prints()
 
     def historicalDataEnd(self, reqId: int, start: str, end: str):
         """Called when historical data download is complete"""
         super().historicalDataEnd(reqId, start, end)
 
-        if reqId != REQUEST_ID:
+        req = self.requests.get(reqId)
+        if req is None:
             return
 
         self.event_counts['historicalDataEnd'] += 1
-        self.data_complete = True
 
-        print()
-        print(f"{GREEN}✅ Historical data complete: {self.bar_count} bars received{RESET}")
-        print(f"   Start: {start}")
-        print(f"   End: {end}")
+        # error() may already have finished this request (e.g. a 10167 notice)
+        if req['error'] is not None or req['complete']:
+            return
+
+        req['complete'] = True
+        self.flush_prints()
+
+        if not self.quiet:
+            print()
+            print(f"{GREEN}✅ {req['symbol']} historical data complete: "
+                  f"{req['bar_count']} bars received{RESET}")
+            print(f"   Start: {start}")
+            print(f"   End: {end}")
+        self.finish_request(reqId)
+
+    def flush_prints(self):
+        """Write buffered bar lines to stdout in a single call"""
+        if self._print_buf:
+            sys.stdout.write("\n".join(self._print_buf) + "\n")
+            self._print_buf.clear()
 
     # ==================== Error Handling ====================
 
     def error(self, reqId: int, errorCode: int, errorString: str, advancedOrderRejectJson=""):
         """Error callback"""
-        # Note: super().error() signature varies by ibapi version
-        try:
-            super().error(reqId, errorCode, errorString, advancedOrderRejectJson)
-        except TypeError:
-            # Older ibapi versions don't have advancedOrderRejectJson parameter
-            super().error(reqId, errorCode, errorString)
+        self.wrapper_error(reqId, errorCode, errorString, advancedOrderRejectJson)
 
-        self.event_counts[f'error_{errorCode}'] += 1
+        self.event_counts[error_event_key(errorCode)] += 1
 
         # Filter out informational messages (don't treat as errors)
-        info_codes = [2104, 2106, 2107, 2108, 2158, 2174, 2176]
-        if errorCode in info_codes:
+        if errorCode in INFO_CODES:
             print(f"ℹ️  TWS Info [{errorCode}]: {errorString}")
             return
 
+        req = self.requests.get(reqId)
+
         # Pacing violation - this is what we're looking for
         if errorCode == 162:
             print(f"{RED}🚨 PACING VIOLATION [{errorCode}]: {errorString}{RESET}")
             print(f"   This means you've exceeded TWS historical data request limits")
             print(f"   Wait 10 minutes before trying again")
-            self.error_occurred = True
-            self.error_message = f"Pacing violation: {errorString}"
-            return
+            error_message = f"Pacing violation: {errorString}"
 
         # Market data errors
-        if errorCode in [354, 10197, 10167]:
+        elif errorCode in MARKET_DATA_ERROR_CODES:
             print(f"{RED}❌ Market Data Error [{errorCode}]: {errorString}{RESET}")
-            self.error_occurred = True
-            self.error_message = f"Market data error: {errorString}"
-            return
+            error_message = f"Market data error: {errorString}"
 
         # Request-specific errors
-        if reqId == REQUEST_ID:
+        elif req is not None:
             print(f"{RED}❌ Request Error [{errorCode}]: {errorString}{RESET}")
-            self.error_occurred = True
-            self.error_message = f"[{errorCode}] {errorString}"
+            error_message = f"[{errorCode}] {errorString}"
+
         else:
             print(f"{YELLOW}⚠️  TWS Error [{errorCode}]: {errorString}{RESET}")
             if reqId != -1:
                 print(f"   Request ID: {reqId}")
+            return
+
+        self.error_occurred = True
+        if req is None:
+            # Not tied to one of our requests: abort the run as before
+            self.error_message = error_message
+            self.done_evt.set()
+        elif req['error'] is None and not req['complete']:
+            req['error'] = error_message
+            self.finish_request(reqId)
 
     # ==================== Results ====================
 
     def print_results(self):
         """Print test results"""
+        self.flush_prints()
         print()
         print("=" * 80)
         print("TEST RESULTS")
@@ -229,17 +281,19 @@ class TestApp(EWrapper, EClient):
         print(f"Data Complete: {self.data_complete}")
         print(f"Bars Received: {self.bar_count}")
         print(f"Error Occurred: {self.error_occurred}")
-        if self.error_message:
-            print(f"Error Message: {self.error_message}")
         print()
 
-        if self.bar_count > 0:
-            print(f"First Bar: {self.bars_received[0]['date']} @ ${self.bars_received[0]['close']:.2f}")
-            print(f"Last Bar:  {self.bars_received[-1]['date']} @ ${self.bars_received[-1]['close']:.2f}")
-            print()
+        for req in self.requests.values():
+            status = "complete" if req['complete'] else (req['error'] or "incomplete")
+            print(f"{req['symbol']}: {req['bar_count']} bars ({status})")
+            if req['bar_count']:
+                first, last = req['first'], req['last']
+                print(f"   First Bar: {format_bar_date(first.date)} @ ${first.close:.2f}")
+                print(f"   Last Bar:  {format_bar_date(last.date)} @ ${last.close:.2f}")
+        print()
 
         print("Event Counts:")
-        for event, count in sorted(self.event_counts.items(), key=lambda x: x[1], reverse=True):
+        for event, count in self.event_counts.most_common():
             print(f"  {event}: {count}")
         print("=" * 80)
 
@@ -247,7 +301,11 @@ class TestApp(EWrapper, EClient):
         if self.error_occurred:
             print()
             print(f"{RED}❌ FAILURE: Request failed with error{RESET}")
-            print(f"   {self.error_message}")
+            if self.error_message:
+                print(f"   {self.error_message}")
+            for req in self.requests.values():
+                if req['error']:
+                    print(f"   {req['symbol']}: {req['error']}")
             return 1
         elif self.data_complete and self.bar_count > 0:
             print()
@@ -270,25 +328,31 @@ class TestApp(EWrapper, EClient):
 
 def main():
     """Main entry point"""
+    parser = argparse.ArgumentParser(description="TWS historical data fetching test")
+    parser.add_argument("symbols", nargs="*", default=["HL"], help="symbols to fetch (default: HL)")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="skip per-bar and per-request progress lines")
+    args = parser.parse_args()
+    symbols = args.symbols
+    waves = -(-len(symbols) // MAX_PENDING)
+
     print("=" * 80)
     print("TWS Python API Historical Data Fetching Test")
     print("=" * 80)
     print(f"Connecting to TWS at {TWS_HOST}:{TWS_PORT}")
-    print(f"Testing symbol: HL (Hecla Mining)")
+    print(f"Testing symbols: {', '.join(symbols)}")
     print(f"Bar size: 5 mins, Duration: 1 day, Session: RTH")
-    print(f"Timeout: {TIMEOUT_SECONDS} seconds")
+    print(f"Timeout: {TIMEOUT_SECONDS * waves} seconds")
     print("=" * 80)
     print()
 
     # Create and start app
-    app = TestApp()
+    app = TestApp(symbols, quiet=args.quiet)
     app.start()
 
     # Wait for connection
     connection_timeout = 10
-    start_time = time.time()
-    while not app.connected and (time.time() - start_time) < connection_timeout:
-        time.sleep(0.1)
+    app.connected_evt.wait(connection_timeout)
 
     if not app.connected:
         print(f"{RED}❌ Failed to connect to TWS{RESET}")
@@ -299,14 +363,10 @@ def main():
         return 1
 
     # Wait for data to complete or timeout
-    start_time = time.time()
-    while not app.data_complete and not app.error_occurred and (time.time() - start_time) < TIMEOUT_SECONDS:
-        time.sleep(0.5)
-
     # Check if timed out
-    if not app.data_complete and not app.error_occurred:
+    if not app.done_evt.wait(TIMEOUT_SECONDS * waves):
         print()
-        print(f"{RED}❌ TIMEOUT: No response after {TIMEOUT_SECONDS} seconds{RESET}")
+        print(f"{RED}❌ TIMEOUT: No response after {TIMEOUT_SECONDS * waves} seconds{RESET}")
         print("   This suggests TWS is not responding to the request")
         print("   Possible causes:")
         print("   - TWS pacing violation (too many requests recently)")
@@ -320,7 +380,7 @@ def main():
     print()
     print(f"{CYAN}🔌 Disconnecting from TWS...{RESET}")
     app.disconnect()
-    time.sleep(1)  # Give time to disconnect cleanly
+    app.closed_evt.wait(2.0)
 
     return exit_code
 
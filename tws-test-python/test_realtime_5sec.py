@@ -8,13 +8,15 @@ import sys
 import time
 import threading
 from datetime import datetime
-from collections import defaultdict
+from collections import Counter
 
 from ibapi.client import EClient
 from ibapi.wrapper import EWrapper
-from ibapi.contract import Contract
 from ibapi.common import RealTimeBar
 
+from tws_common import INFO_CODES, WrapperErrorMixin, error_event_key, make_stk_contract, tune_socket
+from tws_common import BLUE, CYAN, GREEN, RED, RESET, YELLOW
+
 # Configuration
 TWS_HOST = "127.0.0.1"
 TWS_PORT = 7497  # Paper trading port
@@ -22,31 +24,26 @@ CLIENT_ID = 9998
 REQUEST_ID = 12346
 WAIT_SECONDS = 30
 
-# ANSI color codes
-RESET = "\033[0m"
-RED = "\033[31m"
-GREEN = "\033[32m"
-YELLOW = "\033[33m"
-BLUE = "\033[34m"
-CYAN = "\033[36m"
-
 
-class TestApp(EWrapper, EClient):
+class TestApp(WrapperErrorMixin, EWrapper, EClient):
     """TWS API test application for reqRealTimeBars"""
 
     def __init__(self):
         EClient.__init__(self, self)
 
         self.connected = False
+        self.connected_evt = threading.Event()
+        self.closed_evt = threading.Event()
         self.bar_count = 0
         self.last_bar_time = None
-        self.event_counts = defaultdict(int)
+        self.event_counts = Counter()
         self.msg_thread = None
 
     def start(self):
         """Connect to TWS and start message loop"""
         print(f"{CYAN}🔌 Connecting to TWS at {TWS_HOST}:{TWS_PORT}...{RESET}")
         self.connect(TWS_HOST, TWS_PORT, CLIENT_ID)
+        tune_socket(self)
 
         self.msg_thread = threading.Thread(target=self.run, daemon=True)
         self.msg_thread.start()
@@ -70,6 +67,7 @@ class TestApp(EWrapper, EClient):
 
         # Request real-time 5-second bars
         self.request_realtime_bars()
+        self.connected_evt.set()
 
     def connectionClosed(self):
         """Connection closed"""
@@ -77,6 +75,7 @@ class TestApp(EWrapper, EClient):
         self.event_counts['connectionClosed'] += 1
         print(f"{YELLOW}⚠️  Connection closed{RESET}")
         self.connected = False
+        self.closed_evt.set()
 
     # ==================== Real-Time Bar Request ====================
 
@@ -85,11 +84,7 @@ class TestApp(EWrapper, EClient):
         print(f"{BLUE}📡 Requesting real-time 5-second bars (reqRealTimeBars)...{RESET}")
 
         # Create XLE stock contract
-        contract = Contract()
-        contract.symbol = "XLE"
-        contract.secType = "STK"
-        contract.exchange = "SMART"
-        contract.currency = "USD"
+        contract = make_stk_contract("XLE")
 
         print(f"   Contract: {contract.symbol} {contract.secType}")
         print(f"   Request ID: {REQUEST_ID}")
@@ -116,8 +111,6 @@ class TestApp(EWrapper, EClient):
         Called every 5 seconds with a new real-time bar
         THIS IS WHAT WE'RE TESTING
         """
-        super().realtimeBar(reqId, time, open_, high, low, close, volume, wap, count)
-
         if reqId != REQUEST_ID:
             print(f"{YELLOW}⚠️  Received realtimeBar for different reqId: "
                   f"{reqId} (expected: {REQUEST_ID}){RESET}")
@@ -142,16 +135,12 @@ class TestApp(EWrapper, EClient):
 
     def error(self, reqId: int, errorCode: int, errorString: str, advancedOrderRejectJson=""):
         """Error callback"""
-        try:
-            super().error(reqId, errorCode, errorString, advancedOrderRejectJson)
-        except TypeError:
-            super().error(reqId, errorCode, errorString)
+        self.wrapper_error(reqId, errorCode, errorString, advancedOrderRejectJson)
 
-        self.event_counts[f'error_{errorCode}'] += 1
+        self.event_counts[error_event_key(errorCode)] += 1
 
         # Filter out informational messages
-        info_codes = [2104, 2106, 2107, 2108, 2158, 2176]
-        if errorCode in info_codes:
+        if errorCode in INFO_CODES:
             print(f"ℹ️  TWS Info [{errorCode}]: {errorString}")
             return
 
@@ -172,7 +161,7 @@ class TestApp(EWrapper, EClient):
         print(f"Last Bar Time: {self.last_bar_time or 'N/A'}")
         print()
         print("Event Counts:")
-        for event, count in sorted(self.event_counts.items(), key=lambda x: x[1], reverse=True):
+        for event, count in self.event_counts.most_common():
             print(f"  {event}: {count}")
         print("=" * 80)
 
@@ -209,9 +198,7 @@ def main():
 
     # Wait for connection
     timeout = 10
-    start_time = time.time()
-    while not app.connected and (time.time() - start_time) < timeout:
-        time.sleep(0.1)
+    app.connected_evt.wait(timeout)
 
     if not app.connected:
         print(f"{RED}❌ Failed to connect to TWS{RESET}")
@@ -232,10 +219,10 @@ def main():
     print()
     print(f"{CYAN}Canceling real-time bar subscription...{RESET}")
     app.cancelRealTimeBars(REQUEST_ID)
-    time.sleep(1)
 
     # Disconnect
     app.disconnect()
+    app.closed_evt.wait(2.0)
 
     return exit_code
 
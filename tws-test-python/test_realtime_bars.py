@@ -10,30 +10,25 @@ import sys
 import time
 import threading
 from datetime import datetime
-from collections import defaultdict
+from collections import Counter
 
 from ibapi.client import EClient
 from ibapi.wrapper import EWrapper
-from ibapi.contract import Contract
 from ibapi.common import BarData
 
+from tws_common import INFO_CODES, WrapperErrorMixin, error_event_key, make_stk_contract, tune_socket
+from tws_common import BLUE, CYAN, GREEN, RED, RESET, YELLOW
+
 # Configuration
 TWS_HOST = "127.0.0.1"
 TWS_PORT = 7497  # Paper trading port (use 7496 for live)
 CLIENT_ID = 9999
 REQUEST_ID = 12345
 WAIT_SECONDS = 60
-
-# ANSI color codes
-RESET = "\033[0m"
-RED = "\033[31m"
-GREEN = "\033[32m"
-YELLOW = "\033[33m"
-BLUE = "\033[34m"
-CYAN = "\033[36m"
+PRINT_BATCH = 32  # Bar lines buffered per stdout write
 
 
-class TestApp(EWrapper, EClient):
+class TestApp(WrapperErrorMixin, EWrapper, EClient):
     """
     TWS API test application
     Combines EWrapper (callbacks) and EClient (request methods)
@@ -44,11 +39,14 @@ class TestApp(EWrapper, EClient):
 
         # State tracking
         self.connected = False
+        self.connected_evt = threading.Event()
+        self.closed_evt = threading.Event()
         self.historical_data_complete = False
         self.historical_bar_count = 0
         self.update_count = 0
         self.last_update_time = None
-        self.event_counts = defaultdict(int)
+        self.event_counts = Counter()
+        self._print_buf = []
 
         # Thread for message processing
         self.msg_thread = None
@@ -57,6 +55,7 @@ class TestApp(EWrapper, EClient):
         """Connect to TWS and start message loop"""
         print(f"{CYAN}🔌 Connecting to TWS at {TWS_HOST}:{TWS_PORT}...{RESET}")
         self.connect(TWS_HOST, TWS_PORT, CLIENT_ID)
+        tune_socket(self)
 
         # Start message processing thread
         self.msg_thread = threading.Thread(target=self.run, daemon=True)
@@ -86,6 +85,7 @@ class TestApp(EWrapper, EClient):
 
         # Request historical data after connection
         self.request_historical_data()
+        self.connected_evt.set()
 
     def connectAck(self):
         """Connection acknowledged"""
@@ -99,6 +99,7 @@ class TestApp(EWrapper, EClient):
         self.event_counts['connectionClosed'] += 1
         print(f"{YELLOW}⚠️  Connection closed{RESET}")
         self.connected = False
+        self.closed_evt.set()
 
     # ==================== Historical Data Request ====================
 
@@ -107,11 +108,7 @@ class TestApp(EWrapper, EClient):
         print(f"{BLUE}📡 Requesting historical data with keepUpToDate=true...{RESET}")
 
         # Create XLE stock contract
-        contract = Contract()
-        contract.symbol = "AAPL"
-        contract.secType = "STK"
-        contract.exchange = "SMART"
-        contract.currency = "USD"
+        contract = make_stk_contract("AAPL")
 
         print(f"   Contract: {contract.symbol} {contract.secType}")
         print(f"   Request ID: {REQUEST_ID}")
@@ -141,8 +138,6 @@ class TestApp(EWrapper, EClient):
 
     def historicalData(self, reqId: int, bar: BarData):
         """Called for each historical bar"""
-        super().historicalData(reqId, bar)
-
         if reqId != REQUEST_ID:
             return
 
@@ -151,8 +146,11 @@ class TestApp(EWrapper, EClient):
 
         # Print every bar (or every 10th for brevity)
         if self.historical_bar_count <= 5 or self.historical_bar_count % 10 == 0:
-            print(f"   Bar {self.historical_bar_count}: {bar.date} | "
-                  f"Close: ${bar.close:.2f} | Vol: {int(bar.volume)}")
+            self._print_buf.append(
+                f"   Bar {self.historical_bar_count}: {bar.date} | "
+                f"Close: ${bar.close:.2f} | Vol: {bar.volume}")
+            if len(self._print_buf) >= PRINT_BATCH:
+                self.flush_prints()
 
     def historicalDataEnd(self, reqId: int, start: str, end: str):
         """Called when historical data download is complete"""
@@ -163,6 +161,7 @@ class TestApp(EWrapper, EClient):
 
         self.event_counts['historicalDataEnd'] += 1
         self.historical_data_complete = True
+        self.flush_prints()
 
         print()
         print(f"{GREEN}✅ Historical data complete: {self.historical_bar_count} bars received{RESET}")
@@ -175,8 +174,6 @@ class TestApp(EWrapper, EClient):
         Called for real-time bar updates when keepUpToDate=True
         THIS IS WHAT WE'RE TESTING
         """
-        super().historicalDataUpdate(reqId, bar)
-
         if reqId != REQUEST_ID:
             print(f"{YELLOW}⚠️  Received historicalDataUpdate for different reqId: "
                   f"{reqId} (expected: {REQUEST_ID}){RESET}")
@@ -193,26 +190,26 @@ class TestApp(EWrapper, EClient):
         print(f"   High: ${bar.high:.2f}")
         print(f"   Low: ${bar.low:.2f}")
         print(f"   Close: ${bar.close:.2f}")
-        print(f"   Volume: {int(bar.volume)}")
+        print(f"   Volume: {bar.volume}")
         print(f"   Count: {bar.barCount}")
         print(f"   WAP: ${bar.average:.2f}")
 
+    def flush_prints(self):
+        """Write buffered bar lines to stdout in a single call"""
+        if self._print_buf:
+            sys.stdout.write("\n".join(self._print_buf) + "\n")
+            self._print_buf.clear()
+
     # ==================== Error Handling ====================
 
     def error(self, reqId: int, errorCode: int, errorString: str, advancedOrderRejectJson=""):
         """Error callback"""
-        # Note: super().error() signature varies by ibapi version
-        try:
-            super().error(reqId, errorCode, errorString, advancedOrderRejectJson)
-        except TypeError:
-            # Older ibapi versions don't have advancedOrderRejectJson parameter
-            super().error(reqId, errorCode, errorString)
+        self.wrapper_error(reqId, errorCode, errorString, advancedOrderRejectJson)
 
-        self.event_counts[f'error_{errorCode}'] += 1
+        self.event_counts[error_event_key(errorCode)] += 1
 
         # Filter out informational messages
-        info_codes = [2104, 2106, 2107, 2108, 2158, 2176]
-        if errorCode in info_codes:
+        if errorCode in INFO_CODES:
             print(f"ℹ️  TWS Info [{errorCode}]: {errorString}")
             return
 
@@ -224,6 +221,7 @@ class TestApp(EWrapper, EClient):
 
     def print_results(self):
         """Print test results"""
+        self.flush_prints()
         print()
         print("=" * 80)
         print("TEST RESULTS")
@@ -235,7 +233,7 @@ class TestApp(EWrapper, EClient):
         print(f"Last Update Time: {self.last_update_time or 'N/A'}")
         print()
         print("Event Counts:")
-        for event, count in sorted(self.event_counts.items(), key=lambda x: x[1], reverse=True):
+        for event, count in self.event_counts.most_common():
             print(f"  {event}: {count}")
         print("=" * 80)
 
@@ -271,9 +269,7 @@ def main():
 
     # Wait for connection
     timeout = 10
-    start_time = time.time()
-    while not app.connected and (time.time() - start_time) < timeout:
-        time.sleep(0.1)
+    app.connected_evt.wait(timeout)
 
     if not app.connected:
         print(f"{RED}❌ Failed to connect to TWS{RESET}")
@@ -293,6 +289,7 @@ def main():
 
     # Disconnect
     app.disconnect()
+    app.closed_evt.wait(2.0)
 
     return exit_code
 
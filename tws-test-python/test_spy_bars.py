@@ -4,16 +4,17 @@ Test SPY historical bars specifically
 """
 
 import sys
-import time
 import threading
 from datetime import datetime
 from collections import defaultdict
 
 from ibapi.client import EClient
 from ibapi.wrapper import EWrapper
-from ibapi.contract import Contract
 from ibapi.common import BarData
 
+from tws_common import INFO_CODES, WrapperErrorMixin, format_bar_date, make_stk_contract, tune_socket
+from tws_common import BLUE, CYAN, GREEN, RED, RESET, YELLOW
+
 # Configuration
 TWS_HOST = "127.0.0.1"
 TWS_PORT = 7497
@@ -21,28 +22,25 @@ CLIENT_ID = 9995
 REQUEST_ID = 12347
 TIMEOUT_SECONDS = 30
 
-# ANSI colors
-RESET = "\033[0m"
-RED = "\033[31m"
-GREEN = "\033[32m"
-YELLOW = "\033[33m"
-BLUE = "\033[34m"
-CYAN = "\033[36m"
-
 
-class TestApp(EWrapper, EClient):
+class TestApp(WrapperErrorMixin, EWrapper, EClient):
     def __init__(self):
         EClient.__init__(self, self)
         self.connected = False
+        self.connected_evt = threading.Event()
+        self.closed_evt = threading.Event()
+        self.done_evt = threading.Event()
         self.data_complete = False
         self.bar_count = 0
-        self.bars_received = []
+        self.first_bar = None  # First and last ibapi BarData, for the summary
+        self.last_bar = None
         self.error_occurred = False
         self.error_message = None
 
     def start(self):
         print(f"{CYAN}🔌 Connecting to TWS at {TWS_HOST}:{TWS_PORT}...{RESET}")
         self.connect(TWS_HOST, TWS_PORT, CLIENT_ID)
+        tune_socket(self)
         self.msg_thread = threading.Thread(target=self.run, daemon=True)
         self.msg_thread.start()
 
@@ -52,16 +50,18 @@ class TestApp(EWrapper, EClient):
         print(f"{GREEN}✅ Connected to TWS{RESET}")
         print()
         self.request_historical_data()
+        self.connected_evt.set()
+
+    def connectionClosed(self):
+        super().connectionClosed()
+        self.connected = False
+        self.closed_evt.set()
 
     def request_historical_data(self):
         print(f"{BLUE}📡 Requesting SPY historical data...{RESET}")
 
         # Create SPY ETF contract
-        contract = Contract()
-        contract.symbol = "SPY"
-        contract.secType = "STK"
-        contract.exchange = "SMART"
-        contract.currency = "USD"
+        contract = make_stk_contract("SPY")
 
         print(f"   Contract: {contract.symbol} {contract.secType}")
         print(f"   Bar Size: 5 mins")
@@ -77,7 +77,7 @@ class TestApp(EWrapper, EClient):
             barSizeSetting="5 mins",
             whatToShow="TRADES",
             useRTH=1,
-            formatDate=1,
+            formatDate=2,  # Epoch seconds
             keepUpToDate=False,
             chartOptions=[]
         )
@@ -85,19 +85,16 @@ class TestApp(EWrapper, EClient):
         print(f"{YELLOW}⏳ Waiting for data (timeout: {TIMEOUT_SECONDS}s)...{RESET}")
 
     def historicalData(self, reqId: int, bar: BarData):
-        super().historicalData(reqId, bar)
         if reqId != REQUEST_ID:
             return
 
         self.bar_count += 1
-        self.bars_received.append({
-            'date': bar.date,
-            'close': bar.close,
-            'volume': int(bar.volume)
-        })
+        if self.first_bar is None:
+            self.first_bar = bar
+        self.last_bar = bar
 
         if self.bar_count <= 5 or self.bar_count % 10 == 0:
-            print(f"   Bar {self.bar_count}: {bar.date} | C: ${bar.close:.2f} | Vol: {int(bar.volume)}")
+            print(f"   Bar {self.bar_count}: {format_bar_date(bar.date)} | C: ${bar.close:.2f} | Vol: {bar.volume}")
 
     def historicalDataEnd(self, reqId: int, start: str, end: str):
         super().historicalDataEnd(reqId, start, end)
@@ -109,15 +106,13 @@ class TestApp(EWrapper, EClient):
         print(f"{GREEN}✅ Historical data complete: {self.bar_count} bars{RESET}")
         print(f"   Start: {start}")
         print(f"   End: {end}")
+        self.done_evt.set()
 
     def error(self, reqId: int, errorCode: int, errorString: str, advancedOrderRejectJson=""):
-        try:
-            super().error(reqId, errorCode, errorString, advancedOrderRejectJson)
-        except TypeError:
-            super().error(reqId, errorCode, errorString)
+        self.wrapper_error(reqId, errorCode, errorString, advancedOrderRejectJson)
 
         # Filter info messages
-        if errorCode in [2104, 2106, 2107, 2108, 2158, 2174, 2176]:
+        if errorCode in INFO_CODES:
             return
 
         # Pacing violation
@@ -125,12 +120,14 @@ class TestApp(EWrapper, EClient):
             print(f"{RED}🚨 PACING VIOLATION: {errorString}{RESET}")
             self.error_occurred = True
             self.error_message = f"Pacing violation: {errorString}"
+            self.done_evt.set()
             return
 
         if reqId == REQUEST_ID:
             print(f"{RED}❌ Error [{errorCode}]: {errorString}{RESET}")
             self.error_occurred = True
             self.error_message = f"[{errorCode}] {errorString}"
+            self.done_evt.set()
 
     def print_results(self):
         print()
@@ -146,8 +143,9 @@ class TestApp(EWrapper, EClient):
 
         if self.bar_count > 0:
             print()
-            print(f"First: {self.bars_received[0]['date']} @ ${self.bars_received[0]['close']:.2f}")
-            print(f"Last:  {self.bars_received[-1]['date']} @ ${self.bars_received[-1]['close']:.2f}")
+            first, last = self.first_bar, self.last_bar
+            print(f"First: {format_bar_date(first.date)} @ ${first.close:.2f}")
+            print(f"Last:  {format_bar_date(last.date)} @ ${last.close:.2f}")
 
         print("=" * 80)
 
@@ -172,18 +170,14 @@ def main():
     app.start()
 
     # Wait for connection
-    start_time = time.time()
-    while not app.connected and (time.time() - start_time) < 10:
-        time.sleep(0.1)
+    app.connected_evt.wait(10)
 
     if not app.connected:
         print(f"{RED}❌ Failed to connect{RESET}")
         return 1
 
     # Wait for data
-    start_time = time.time()
-    while not app.data_complete and not app.error_occurred and (time.time() - start_time) < TIMEOUT_SECONDS:
-        time.sleep(0.5)
+    app.done_evt.wait(TIMEOUT_SECONDS)
 
     if not app.data_complete and not app.error_occurred:
         print(f"{RED}❌ TIMEOUT{RESET}")
@@ -193,7 +187,7 @@ def main():
     print()
     print(f"{CYAN}🔌 Disconnecting...{RESET}")
     app.disconnect()
-    time.sleep(1)
+    app.closed_evt.wait(2.0)
 
     return exit_code
 
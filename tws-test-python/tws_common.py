@@ -0,0 +1,100 @@
+"""
+Shared helpers for the TWS Python API test scripts
+"""
+
+import sys
+import socket
+import inspect
+import logging
+from datetime import datetime
+from functools import lru_cache
+
+from ibapi.contract import Contract
+from ibapi.wrapper import EWrapper
+
+# ANSI color codes, blank when stdout is piped to a file or CI log
+_COLOR = sys.stdout.isatty()
+RESET = "\033[0m" if _COLOR else ""
+RED = "\033[31m" if _COLOR else ""
+GREEN = "\033[32m" if _COLOR else ""
+YELLOW = "\033[33m" if _COLOR else ""
+BLUE = "\033[34m" if _COLOR else ""
+CYAN = "\033[36m" if _COLOR else ""
+
+# ibapi logs every decoded message at DEBUG and every wrapper callback at
+# INFO; the scripts report errors themselves, so keep its logger quiet even
+# if a caller configures the root logger more verbosely
+logging.getLogger("ibapi").setLevel(logging.ERROR)
+
+# EWrapper.error gained an advancedOrderRejectJson parameter in newer ibapi
+# releases; resolve which signature is installed once at import time
+ERROR_TAKES_ADVANCED_REJECT = (
+    'advancedOrderRejectJson' in inspect.signature(EWrapper.error).parameters
+)
+
+
+class WrapperErrorMixin:
+    """
+    Provides wrapper_error(), forwarding to EWrapper.error with the
+    signature the installed ibapi version accepts
+    """
+
+    if ERROR_TAKES_ADVANCED_REJECT:
+        def wrapper_error(self, reqId: int, errorCode: int, errorString: str,
+                          advancedOrderRejectJson=""):
+            EWrapper.error(self, reqId, errorCode, errorString, advancedOrderRejectJson)
+    else:
+        def wrapper_error(self, reqId: int, errorCode: int, errorString: str,
+                          advancedOrderRejectJson=""):
+            EWrapper.error(self, reqId, errorCode, errorString)
+
+
+# TWS informational notices (market data farm status etc.), not errors
+INFO_CODES = frozenset({2104, 2106, 2107, 2108, 2158, 2174, 2176})
+
+# Market data permission / subscription errors
+MARKET_DATA_ERROR_CODES = frozenset({354, 10167, 10197})
+
+_ERROR_EVENT_KEYS = {}
+
+
+def error_event_key(errorCode: int) -> str:
+    """Return the event_counts key for an error code, built once per code"""
+    key = _ERROR_EVENT_KEYS.get(errorCode)
+    if key is None:
+        key = _ERROR_EVENT_KEYS[errorCode] = f'error_{errorCode}'
+    return key
+
+
+def format_bar_date(date: str) -> str:
+    """
+    Render a formatDate=2 bar date (epoch seconds) as local yyyymmdd  hh:mm:ss
+    Daily and larger bars still arrive as yyyymmdd and are returned unchanged
+    """
+    if date.isdigit() and len(date) > 8:
+        return datetime.fromtimestamp(int(date)).strftime('%Y%m%d  %H:%M:%S')
+    return date
+
+
+@lru_cache(maxsize=128)
+def make_stk_contract(symbol: str) -> Contract:
+    """Build a SMART-routed USD stock contract, once per symbol"""
+    contract = Contract()
+    contract.symbol = symbol
+    contract.secType = "STK"
+    contract.exchange = "SMART"
+    contract.currency = "USD"
+    return contract
+
+
+def tune_socket(client) -> None:
+    """
+    Disable Nagle and enlarge the receive buffer on a connected EClient's
+    socket, so request frames go out immediately and historical bursts
+    need fewer recv calls
+    """
+    if not client.isConnected():
+        return
+    sock = client.conn.socket
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
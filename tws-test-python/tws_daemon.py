@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+TWS Python API Test Daemon
+Holds one TWS connection open and serves historical data requests over a
+Unix socket, so repeated test runs skip the connect/handshake round trip
+
+Usage:
+    python3 tws_daemon.py serve                  # start the daemon
+    python3 tws_daemon.py hist HL                # fetch via the daemon
+    python3 tws_daemon.py hist SPY --bar-size "1 min" --duration "1 D"
+    python3 tws_daemon.py hist HL --fresh        # bypass the daemon's bar cache
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import argparse
+import itertools
+import threading
+import socketserver
+from datetime import date
+
+from ibapi.client import EClient
+from ibapi.wrapper import EWrapper
+from ibapi.common import BarData
+
+from tws_common import INFO_CODES, WrapperErrorMixin, make_stk_contract, tune_socket
+from tws_common import BLUE, CYAN, GREEN, RED, RESET, YELLOW
+
+# Configuration
+TWS_HOST = "127.0.0.1"
+TWS_PORT = 7497  # Paper trading port (use 7496 for live)
+CLIENT_ID = 9996
+SOCKET_PATH = "/tmp/tws-test.sock"
+TIMEOUT_SECONDS = 30
+CACHE_TTL_SECONDS = 3600  # Completed bar sets are replayed for this long
+
+
+class DaemonApp(WrapperErrorMixin, EWrapper, EClient):
+    """
+    Long-lived TWS client shared by every daemon request
+    Callbacks are routed to a per-request queue keyed by reqId
+    """
+
+    def __init__(self):
+        EClient.__init__(self, self)
+
+        self.connected = False
+        self.connected_evt = threading.Event()
+        self.closed_evt = threading.Event()
+        self._next_req_id = itertools.count(10000).__next__
+        self._requests = {}  # reqId -> queue.Queue of (kind, payload)
+
+        # Thread for message processing
+        self.msg_thread = None
+
+    def start(self):
+        """Connect to TWS and start message loop"""
+        print(f"{CYAN}🔌 Connecting to TWS at {TWS_HOST}:{TWS_PORT}...{RESET}")
+        self.connect(TWS_HOST, TWS_PORT, CLIENT_ID)
+        tune_socket(self)
+
+        # Start message processing thread
+        self.msg_thread = threading.Thread(target=self.run, daemon=True)
+        self.msg_thread.start()
+
+    # ==================== Connection Callbacks ====================
+
+    def nextValidId(self, orderId: int):
+        """Called when connection is established"""
+        super().nextValidId(orderId)
+        self.connected = True
+        print(f"{GREEN}✅ Connected to TWS{RESET}")
+        self.connected_evt.set()
+
+    def connectionClosed(self):
+        """Connection closed"""
+        super().connectionClosed()
+        print(f"{YELLOW}⚠️  Connection closed{RESET}")
+        self.connected = False
+        self.closed_evt.set()
+
+    # ==================== Historical Data ====================
+
+    def request_historical_data(self, symbol: str, bar_size: str, duration: str):
+        """Issue a historical request; returns (reqId, queue) for its callbacks"""
+        contract = make_stk_contract(symbol)
+
+        req_id = self._next_req_id()
+        results = queue.Queue()
+        self._requests[req_id] = results
+
+        self.reqHistoricalData(
+            reqId=req_id,
+            contract=contract,
+            endDateTime="",         # Empty string = current time
+            durationStr=duration,
+            barSizeSetting=bar_size,
+            whatToShow="TRADES",    # Trade data
+            useRTH=1,               # Regular trading hours only
+            formatDate=1,           # Format: yyyymmdd  hh:mm:ss
+            keepUpToDate=False,     # No real-time streaming
+            chartOptions=[]
+        )
+        return req_id, results
+
+    def release(self, req_id: int):
+        """Stop routing callbacks for a finished request"""
+        self._requests.pop(req_id, None)
+
+    def historicalData(self, reqId: int, bar: BarData):
+        """Called for each historical bar"""
+        results = self._requests.get(reqId)
+        if results is not None:
+            results.put(("bar", {
+                'date': bar.date,
+                'open': bar.open,
+                'high': bar.high,
+                'low': bar.low,
+                'close': bar.close,
+                'volume': int(bar.volume),
+            }))
+
+    def historicalDataEnd(self, reqId: int, start: str, end: str):
+        """Called when historical data download is complete"""
+        results = self._requests.get(reqId)
+        if results is not None:
+            results.put(("end", {'start': start, 'end': end}))
+
+    # ==================== Error Handling ====================
+
+    def error(self, reqId: int, errorCode: int, errorString: str, advancedOrderRejectJson=""):
+        """Error callback"""
+        self.wrapper_error(reqId, errorCode, errorString, advancedOrderRejectJson)
+
+        # Filter out informational messages (don't treat as errors)
+        if errorCode in INFO_CODES:
+            return
+
+        results = self._requests.get(reqId)
+        if results is not None:
+            results.put(("error", {'code': errorCode, 'message': errorString}))
+        else:
+            print(f"{YELLOW}⚠️  TWS Error [{errorCode}]: {errorString}{RESET}")
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    One JSON request line in, JSON reply lines out
+    Request: {"cmd": "hist", "symbol": "HL", "bar_size": "5 mins", "duration": "1 D",
+              "fresh": false}
+    Replies: {"type": "bar", ...} lines, then one {"type": "end" | "error", ...}
+    A completed fetch is cached per (symbol, bar size, duration, day) and
+    replayed for CACHE_TTL_SECONDS unless the request sets "fresh"
+    """
+
+    def send(self, kind: str, payload: dict):
+        self.wfile.write(json.dumps({'type': kind, **payload}).encode() + b"\n")
+
+    def handle(self):
+        app = self.server.app
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            self.send("error", {'code': -1, 'message': "invalid request"})
+            return
+
+        if request.get('cmd') != "hist":
+            self.send("error", {'code': -1, 'message': f"unknown command: {request.get('cmd')}"})
+            return
+        if not app.connected:
+            self.send("error", {'code': -1, 'message': "daemon is not connected to TWS"})
+            return
+
+        symbol = request.get('symbol', "HL")
+        bar_size = request.get('bar_size', "5 mins")
+        duration = request.get('duration', "1 D")
+        cache_key = (symbol, bar_size, duration, date.today())
+        cache = self.server.cache
+
+        cached = cache.get(cache_key)
+        if cached is not None and not request.get('fresh'):
+            stored_at, bars, end = cached
+            if time.monotonic() - stored_at < CACHE_TTL_SECONDS:
+                print(f"{CYAN}💾 hist {symbol} {bar_size} {duration} (cached){RESET}")
+                for bar in bars:
+                    self.send("bar", bar)
+                self.send("end", {**end, 'cached': True})
+                return
+
+        print(f"{BLUE}📡 hist {symbol} {bar_size} {duration}{RESET}")
+        req_id, results = app.request_historical_data(symbol, bar_size, duration)
+        bars = []
+        try:
+            while True:
+                try:
+                    kind, payload = results.get(timeout=TIMEOUT_SECONDS)
+                except queue.Empty:
+                    app.cancelHistoricalData(req_id)
+                    self.send("error", {'code': -1,
+                                        'message': f"no response after {TIMEOUT_SECONDS} seconds"})
+                    return
+                self.send(kind, payload)
+                if kind == "bar":
+                    bars.append(payload)
+                    continue
+                if kind == "end":
+                    cache[cache_key] = (time.monotonic(), bars, payload)
+                return
+        finally:
+            app.release(req_id)
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, app: DaemonApp):
+        self.app = app
+        self.cache = {}  # (symbol, bar_size, duration, day) -> (stored_at, bars, end)
+        super().__init__(path, RequestHandler)
+
+
+def serve():
+    """Connect once and serve requests until interrupted"""
+    app = DaemonApp()
+    app.start()
+
+    connection_timeout = 10
+    app.connected_evt.wait(connection_timeout)
+    if not app.connected:
+        print(f"{RED}❌ Failed to connect to TWS{RESET}")
+        print(f"   Make sure TWS or IB Gateway is running on {TWS_HOST}:{TWS_PORT}")
+        return 1
+
+    # Clear a socket left behind by a previous run
+    if os.path.exists(SOCKET_PATH):
+        os.unlink(SOCKET_PATH)
+
+    server = DaemonServer(SOCKET_PATH, app)
+    print(f"{GREEN}✅ Listening on {SOCKET_PATH}{RESET}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print()
+        print(f"{YELLOW}⚠️  Interrupted by user{RESET}")
+    finally:
+        server.server_close()
+        os.unlink(SOCKET_PATH)
+        app.disconnect()
+        app.closed_evt.wait(2.0)
+    return 0
+
+
+def hist(symbol: str, bar_size: str, duration: str, fresh: bool = False):
+    """Fetch historical bars through a running daemon"""
+    request = {'cmd': "hist", 'symbol': symbol, 'bar_size': bar_size, 'duration': duration,
+               'fresh': fresh}
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(SOCKET_PATH)
+    except OSError as e:
+        print(f"{RED}❌ Cannot reach daemon at {SOCKET_PATH}: {e}{RESET}")
+        print("   Start it with: python3 tws_daemon.py serve")
+        return 1
+
+    print(f"{BLUE}📡 Requesting {symbol} {bar_size} bars ({duration})...{RESET}")
+    bar_count = 0
+    with sock, sock.makefile("rb") as replies:
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        for line in replies:
+            reply = json.loads(line)
+            if reply['type'] == "bar":
+                bar_count += 1
+                if bar_count <= 5 or bar_count % 10 == 0:
+                    print(f"   Bar {bar_count}: {reply['date']} | "
+                          f"C: ${reply['close']:.2f} | Vol: {reply['volume']}")
+            elif reply['type'] == "end":
+                print()
+                source = " (cached)" if reply.get('cached') else ""
+                print(f"{GREEN}✅ Historical data complete: {bar_count} bars{source}{RESET}")
+                print(f"   Start: {reply['start']}")
+                print(f"   End: {reply['end']}")
+                return 0 if bar_count > 0 else 1
+            else:
+                print(f"{RED}❌ Error [{reply['code']}]: {reply['message']}{RESET}")
+                return 1
+
+    print(f"{RED}❌ Daemon closed the connection without a result{RESET}")
+    return 1
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Persistent TWS connection for repeated test runs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("serve", help="connect to TWS and listen on " + SOCKET_PATH)
+    hist_parser = commands.add_parser("hist", help="fetch historical bars via the daemon")
+    hist_parser.add_argument("symbol", nargs="?", default="HL")
+    hist_parser.add_argument("--bar-size", default="5 mins")
+    hist_parser.add_argument("--duration", default="1 D")
+    hist_parser.add_argument("--fresh", action="store_true", help="skip the daemon's bar cache")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        return serve()
+    return hist(args.symbol, args.bar_size, args.duration, args.fresh)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+TWS Python API Combined Test
+Runs the historical, reqRealTimeBars and keepUpToDate tests over a single
+TWS connection, dispatching callbacks on reqId
+"""
+
+import sys
+import time
+import argparse
+import threading
+from datetime import datetime
+from collections import Counter
+
+from ibapi.client import EClient
+from ibapi.wrapper import EWrapper
+from ibapi.common import BarData
+
+from tws_common import (
+    INFO_CODES, WrapperErrorMixin, error_event_key, format_bar_date, make_stk_contract, tune_socket
+)
+from tws_common import BLUE, CYAN, GREEN, RED, RESET, YELLOW
+
+# Configuration
+TWS_HOST = "127.0.0.1"
+TWS_PORT = 7497  # Paper trading port (use 7496 for live)
+CLIENT_ID = 9997
+HDU_REQID = 12345   # Historical data with keepUpToDate (test_realtime_bars.py)
+HIST_REQID = 12346  # Historical data fetch (test_historical_bars.py)
+RT5_REQID = 12347   # reqRealTimeBars 5-second bars (test_realtime_5sec.py)
+TIMEOUT_SECONDS = 30  # Historical fetch timeout
+RT5_WAIT_SECONDS = 30
+HDU_WAIT_SECONDS = 60
+PRINT_BATCH = 32  # Bar lines buffered per stdout write
+
+
+class TestApp(WrapperErrorMixin, EWrapper, EClient):
+    """
+    TWS API test application running several tests on one connection
+    Each test owns a reqId and a state dict; callbacks route on reqId
+    """
+
+    def __init__(self, run_hist=True, run_rt5=True, run_hdu=True):
+        EClient.__init__(self, self)
+
+        self.run_hist = run_hist
+        self.run_rt5 = run_rt5
+        self.run_hdu = run_hdu
+
+        # State tracking
+        self.connected = False
+        self.connected_evt = threading.Event()
+        self.closed_evt = threading.Event()
+        self.hist_done_evt = threading.Event()
+        self.event_counts = Counter()
+        self._print_buf = []
+
+        self.hist = {'complete': False, 'bar_count': 0, 'first': None, 'last': None,
+                     'error': None}
+        self.rt5 = {'bar_count': 0, 'last_bar_time': None}
+        self.hdu = {'complete': False, 'bar_count': 0, 'update_count': 0,
+                    'last_update_time': None}
+
+        # Thread for message processing
+        self.msg_thread = None
+
+    def start(self):
+        """Connect to TWS and start message loop"""
+        print(f"{CYAN}🔌 Connecting to TWS at {TWS_HOST}:{TWS_PORT}...{RESET}")
+        self.connect(TWS_HOST, TWS_PORT, CLIENT_ID)
+        tune_socket(self)
+
+        # Start message processing thread
+        self.msg_thread = threading.Thread(target=self.run, daemon=True)
+        self.msg_thread.start()
+
+    # ==================== Connection Callbacks ====================
+
+    def nextValidId(self, orderId: int):
+        """Called when connection is established"""
+        super().nextValidId(orderId)
+        self.connected = True
+        self.event_counts['nextValidId'] += 1
+
+        print(f"{GREEN}✅ Connected to TWS{RESET}")
+        print(f"   Next valid order ID: {orderId}")
+        print()
+
+        # Streaming tests need live market data (Type 1)
+        if self.run_rt5 or self.run_hdu:
+            print(f"{CYAN}📡 Requesting LIVE market data (Type 1)...{RESET}")
+            self.reqMarketDataType(1)
+            print()
+
+        # Fire every selected request over this one connection
+        if self.run_hist:
+            self.request_historical_data()
+        if self.run_rt5:
+            self.request_realtime_bars()
+        if self.run_hdu:
+            self.request_keep_up_to_date()
+        self.connected_evt.set()
+
+    def connectAck(self):
+        """Connection acknowledged"""
+        super().connectAck()
+        self.event_counts['connectAck'] += 1
+        print(f"{GREEN}Connection acknowledged{RESET}")
+
+    def connectionClosed(self):
+        """Connection closed"""
+        super().connectionClosed()
+        self.event_counts['connectionClosed'] += 1
+        print(f"{YELLOW}⚠️  Connection closed{RESET}")
+        self.connected = False
+        self.closed_evt.set()
+
+    # ==================== Requests ====================
+
+    def request_historical_data(self):
+        """Request historical data for HL (5-minute bars, 1 day)"""
+        print(f"{BLUE}📡 [hist] Requesting HL historical data (Request ID: {HIST_REQID})...{RESET}")
+        self.reqHistoricalData(
+            reqId=HIST_REQID,
+            contract=make_stk_contract("HL"),
+            endDateTime="",         # Empty string = current time
+            durationStr="1 D",      # 1 day of data
+            barSizeSetting="5 mins",  # 5-minute bars
+            whatToShow="TRADES",    # Trade data
+            useRTH=1,               # Regular trading hours only
+            formatDate=2,           # Format: epoch seconds
+            keepUpToDate=False,     # No real-time streaming
+            chartOptions=[]
+        )
+
+    def request_realtime_bars(self):
+        """Request real-time 5-second bars for XLE"""
+        print(f"{BLUE}📡 [rt5] Requesting XLE 5-second bars (Request ID: {RT5_REQID})...{RESET}")
+        self.reqRealTimeBars(
+            reqId=RT5_REQID,
+            contract=make_stk_contract("XLE"),
+            barSize=5,  # Only 5 seconds supported
+            whatToShow="TRADES",
+            useRTH=True,  # Regular trading hours only
+            realTimeBarsOptions=[]
+        )
+
+    def request_keep_up_to_date(self):
+        """Request AAPL historical data with keepUpToDate=true"""
+        print(f"{BLUE}📡 [hdu] Requesting AAPL historical data with keepUpToDate=true "
+              f"(Request ID: {HDU_REQID})...{RESET}")
+        self.reqHistoricalData(
+            reqId=HDU_REQID,
+            contract=make_stk_contract("AAPL"),
+            endDateTime="",         # Empty string = current time (required for keepUpToDate)
+            durationStr="1 D",      # 1 day of data
+            barSizeSetting="5 mins",  # 5-minute bars
+            whatToShow="TRADES",    # Trade data
+            useRTH=1,               # Regular trading hours only
+            formatDate=1,           # Format: yyyymmdd  hh:mm:ss
+            keepUpToDate=True,      # Enable real-time streaming
+            chartOptions=[]
+        )
+
+    # ==================== Historical Data Callbacks ====================
+
+    def historicalData(self, reqId: int, bar: BarData):
+        """Called for each historical bar of the hist and hdu requests"""
+        if reqId == HIST_REQID:
+            state, tag = self.hist, "hist"
+        elif reqId == HDU_REQID:
+            state, tag = self.hdu, "hdu"
+        else:
+            return
+
+        self.event_counts['historicalData'] += 1
+        state['bar_count'] += 1
+        if reqId == HIST_REQID:
+            if state['first'] is None:
+                state['first'] = bar
+            state['last'] = bar
+
+        # Print first 5 bars, then every 10th
+        count = state['bar_count']
+        if count <= 5 or count % 10 == 0:
+            self._print_buf.append(
+                f"   [{tag}] Bar {count}: {format_bar_date(bar.date)} | "
+                f"Close: ${bar.close:.2f} | Vol: {bar.volume}")
+            if len(self._print_buf) >= PRINT_BATCH:
+                self.flush_prints()
+
+    def historicalDataEnd(self, reqId: int, start: str, end: str):
+        """Called when a historical data download is complete"""
+        super().historicalDataEnd(reqId, start, end)
+
+        if reqId == HIST_REQID:
+            state, tag = self.hist, "hist"
+        elif reqId == HDU_REQID:
+            state, tag = self.hdu, "hdu"
+        else:
+            return
+
+        self.event_counts['historicalDataEnd'] += 1
+        state['complete'] = True
+        self.flush_prints()
+
+        print()
+        print(f"{GREEN}✅ [{tag}] Historical data complete: {state['bar_count']} bars received{RESET}")
+        print(f"   Start: {start}")
+        print(f"   End: {end}")
+        if reqId == HIST_REQID:
+            self.hist_done_evt.set()
+
+    def historicalDataUpdate(self, reqId: int, bar: BarData):
+        """Called for real-time bar updates when keepUpToDate=True"""
+        if reqId != HDU_REQID:
+            return
+
+        self.event_counts['historicalDataUpdate'] += 1
+        self.hdu['update_count'] += 1
+        self.hdu['last_update_time'] = bar.date
+
+        print(f"{GREEN}🎯 [hdu] REAL-TIME UPDATE #{self.hdu['update_count']}: "
+              f"{bar.date} | O: ${bar.open:.2f} | H: ${bar.high:.2f} | "
+              f"L: ${bar.low:.2f} | C: ${bar.close:.2f} | Vol: {bar.volume}{RESET}")
+
+    def flush_prints(self):
+        """Write buffered bar lines to stdout in a single call"""
+        if self._print_buf:
+            sys.stdout.write("\n".join(self._print_buf) + "\n")
+            self._print_buf.clear()
+
+    # ==================== Real-Time Bar Callback ====================
+
+    def realtimeBar(self, reqId: int, time: int, open_: float, high: float,
+                     low: float, close: float, volume: int, wap: float, count: int):
+        """Called every 5 seconds with a new real-time bar"""
+        if reqId != RT5_REQID:
+            return
+
+        self.event_counts['realtimeBar'] += 1
+        self.rt5['bar_count'] += 1
+        self.rt5['last_bar_time'] = datetime.fromtimestamp(time).strftime('%Y-%m-%d %H:%M:%S')
+
+        print(f"{GREEN}🎯 [rt5] REAL-TIME BAR #{self.rt5['bar_count']}: "
+              f"{self.rt5['last_bar_time']} | O: ${open_:.2f} | H: ${high:.2f} | "
+              f"L: ${low:.2f} | C: ${close:.2f} | Vol: {volume}{RESET}")
+
+    # ==================== Error Handling ====================
+
+    def error(self, reqId: int, errorCode: int, errorString: str, advancedOrderRejectJson=""):
+        """Error callback"""
+        self.wrapper_error(reqId, errorCode, errorString, advancedOrderRejectJson)
+
+        self.event_counts[error_event_key(errorCode)] += 1
+
+        # Filter out informational messages (don't treat as errors)
+        if errorCode in INFO_CODES:
+            print(f"ℹ️  TWS Info [{errorCode}]: {errorString}")
+            return
+
+        if errorCode == 162:
+            print(f"{RED}🚨 PACING VIOLATION [{errorCode}]: {errorString}{RESET}")
+        else:
+            print(f"{RED}❌ TWS Error [{errorCode}]: {errorString}{RESET}")
+        if reqId != -1:
+            print(f"   Request ID: {reqId}")
+
+        # Only the historical fetch treats an error as a terminal result
+        if reqId == HIST_REQID:
+            self.hist['error'] = f"[{errorCode}] {errorString}"
+            self.hist_done_evt.set()
+
+    # ==================== Results ====================
+
+    def hist_result(self):
+        """Print the historical fetch result and return its exit code"""
+        hist = self.hist
+        print(f"[hist] Data Complete: {hist['complete']}")
+        print(f"[hist] Bars Received: {hist['bar_count']}")
+        if hist['first'] is not None:
+            print(f"[hist] First Bar: {format_bar_date(hist['first'].date)} @ ${hist['first'].close:.2f}")
+            print(f"[hist] Last Bar:  {format_bar_date(hist['last'].date)} @ ${hist['last'].close:.2f}")
+
+        if hist['error']:
+            print(f"{RED}❌ [hist] FAILURE: {hist['error']}{RESET}")
+            return 1
+        if hist['complete'] and hist['bar_count'] > 0:
+            print(f"{GREEN}✅ [hist] SUCCESS: Historical data fetched successfully!{RESET}")
+            return 0
+        if hist['bar_count'] > 0:
+            print(f"{YELLOW}⚠️  [hist] PARTIAL: Received bars but no completion signal{RESET}")
+            return 1
+        print(f"{RED}❌ [hist] FAILURE: No bars received{RESET}")
+        return 1
+
+    def rt5_result(self):
+        """Print the reqRealTimeBars result and return its exit code"""
+        print(f"[rt5] Real-Time Bars Received: {self.rt5['bar_count']}")
+        print(f"[rt5] Last Bar Time: {self.rt5['last_bar_time'] or 'N/A'}")
+        if self.rt5['bar_count'] > 0:
+            print(f"{GREEN}✅ [rt5] SUCCESS: Real-time bars are working!{RESET}")
+            return 0
+        print(f"{RED}❌ [rt5] FAILURE: No real-time bars received{RESET}")
+        return 1
+
+    def hdu_result(self):
+        """Print the keepUpToDate result and return its exit code"""
+        hdu = self.hdu
+        print(f"[hdu] Historical Data Complete: {hdu['complete']}")
+        print(f"[hdu] Historical Bars Received: {hdu['bar_count']}")
+        print(f"[hdu] Real-Time Updates Received: {hdu['update_count']}")
+        print(f"[hdu] Last Update Time: {hdu['last_update_time'] or 'N/A'}")
+        if hdu['update_count'] > 0:
+            print(f"{GREEN}✅ [hdu] SUCCESS: Real-time updates are working!{RESET}")
+            return 0
+        print(f"{RED}❌ [hdu] FAILURE: No real-time updates received{RESET}")
+        return 1
+
+    def print_results(self):
+        """Print results for every selected test; non-zero if any failed"""
+        self.flush_prints()
+        print()
+        print("=" * 80)
+        print("TEST RESULTS")
+        print("=" * 80)
+        print(f"Connected: {self.connected}")
+        print()
+
+        exit_code = 0
+        if self.run_hist:
+            exit_code |= self.hist_result()
+            print()
+        if self.run_rt5:
+            exit_code |= self.rt5_result()
+            print()
+        if self.run_hdu:
+            exit_code |= self.hdu_result()
+            print()
+
+        print("Event Counts:")
+        for event, count in self.event_counts.most_common():
+            print(f"  {event}: {count}")
+        print("=" * 80)
+
+        return exit_code
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Run TWS API tests over one connection")
+    parser.add_argument("--hist", action="store_true", help="historical fetch (HL, 5 mins, 1 D)")
+    parser.add_argument("--rt5", action="store_true", help="reqRealTimeBars 5-second bars (XLE)")
+    parser.add_argument("--hdu", action="store_true", help="keepUpToDate updates (AAPL, 5 mins)")
+    args = parser.parse_args()
+
+    # No flags = run everything
+    if not (args.hist or args.rt5 or args.hdu):
+        args.hist = args.rt5 = args.hdu = True
+
+    selected = [name for name in ("hist", "rt5", "hdu") if getattr(args, name)]
+    stream_seconds = max(RT5_WAIT_SECONDS if args.rt5 else 0,
+                         HDU_WAIT_SECONDS if args.hdu else 0)
+
+    print("=" * 80)
+    print("TWS Python API Combined Test")
+    print("=" * 80)
+    print(f"Connecting to TWS at {TWS_HOST}:{TWS_PORT}")
+    print(f"Tests: {', '.join(selected)}")
+    if stream_seconds:
+        print(f"Will wait {stream_seconds} seconds for real-time data...")
+    print("=" * 80)
+    print()
+
+    # Create and start app
+    app = TestApp(run_hist=args.hist, run_rt5=args.rt5, run_hdu=args.hdu)
+    app.start()
+
+    # Wait for connection
+    connection_timeout = 10
+    app.connected_evt.wait(connection_timeout)
+
+    if not app.connected:
+        print(f"{RED}❌ Failed to connect to TWS{RESET}")
+        print(f"   Make sure TWS or IB Gateway is running on {TWS_HOST}:{TWS_PORT}")
+        print("   Check TWS API settings: Configuration → API → Settings")
+        return 1
+
+    # Streaming windows and the historical timeout run concurrently
+    deadline = time.monotonic() + stream_seconds
+    try:
+        if args.hist:
+            if not app.hist_done_evt.wait(TIMEOUT_SECONDS):
+                print()
+                print(f"{RED}❌ [hist] TIMEOUT: No response after {TIMEOUT_SECONDS} seconds{RESET}")
+        remaining = deadline - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+    except KeyboardInterrupt:
+        print()
+        print(f"{YELLOW}⚠️  Interrupted by user{RESET}")
+
+    # Print results
+    exit_code = app.print_results()
+
+    # Cancel subscriptions and disconnect
+    print()
+    print(f"{CYAN}🔌 Disconnecting from TWS...{RESET}")
+    if args.rt5:
+        app.cancelRealTimeBars(RT5_REQID)
+    if args.hdu:
+        app.cancelHistoricalData(HDU_REQID)
+    app.disconnect()
+    app.closed_evt.wait(2.0)
+
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())